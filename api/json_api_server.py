@@ -6,15 +6,23 @@ current_dir = os.path.dirname(os.path.abspath(__file__))
 parent_dir = os.path.dirname(current_dir)
 sys.path.insert(0, parent_dir)
 
-from flask import Flask, jsonify, request
+from flask import Flask, jsonify, request, make_response, send_from_directory
 from flask_cors import CORS
-from database.db_manager import DatabaseManager
+from database.db_manager import DatabaseManager, PRICE_HISTORY_BUCKETS
+from api.response_cache import ResponseCache
+from api.snapshot_store import SnapshotStore
 from utils.logger import setup_logger
-from utils.helpers import load_json, format_price
+from utils.serialization import FastJSONProvider
+from utils.helpers import load_json, format_price, extract_product_key
+from utils.delta_exporter import DELTA_ARTIFACTS
 from datetime import datetime
+import base64
+import time
 import os
 
 app = Flask(__name__)
+# Serialización central: datetime en ISO 8601 y Decimal como número (orjson si está instalado)
+app.json = FastJSONProvider(app)
 CORS(app)
 
 logger = setup_logger('api_server')
@@ -26,6 +34,35 @@ RESULTS_JSON = os.path.join(DATA_DIR, 'results.json')
 FILES_JSON = os.path.join(DATA_DIR, 'files.json')
 EVENTS_JSON = os.path.join(DATA_DIR, 'events.json')
 
+# Exportación incremental (manifest + segmentos NDJSON por artefacto)
+DELTA_DIR = os.path.join(DATA_DIR, 'delta')
+
+SNAPSHOT_FILES = {
+    'results': RESULTS_JSON,
+    'files': FILES_JSON,
+    'events': EVENTS_JSON
+}
+
+# Modo snapshot: las lecturas se sirven desde data/*.json sin consultar la BD
+SNAPSHOT_MODE = os.getenv('API_SNAPSHOT_MODE', 'false').lower() == 'true'
+snapshots = SnapshotStore(
+    SNAPSHOT_FILES.values(),
+    check_interval=float(os.getenv('API_SNAPSHOT_CHECK_INTERVAL', 2))
+)
+
+# Cache de respuestas de lectura, invalidado por el último evento de scraping
+# (o por el cambio de los snapshots en modo snapshot)
+response_cache = ResponseCache(
+    version_func=snapshots.version if SNAPSHOT_MODE else db.get_latest_event_id,
+    maxsize=int(os.getenv('API_CACHE_SIZE', 256)),
+    ttl=int(os.getenv('API_CACHE_TTL', 300)),
+    version_interval=float(os.getenv('API_CACHE_VERSION_INTERVAL', 5)),
+    client_max_age=int(os.getenv('API_CACHE_MAX_AGE', 0))
+)
+
+# Tamaño máximo de página en /api/products
+MAX_PAGE_SIZE = 500
+
 @app.route('/')
 def home():
     """Endpoint principal"""
@@ -36,7 +73,11 @@ def home():
             'products': '/api/products',
             'files': '/api/files',
             'events': '/api/events',
+            'search': '/api/products/search?q=',
             'stats': '/api/stats',
+            'category_stats': '/api/categories/<name>/stats',
+            'snapshots': '/api/snapshots/<results|files|events>',
+            'delta': '/api/delta/<results|files|events>/manifest.json',
             'health': '/api/health'
         }
     })
@@ -45,9 +86,8 @@ def home():
 def health():
     """Verifica el estado de la API"""
     try:
-        # Intentar conectar a la base de datos
-        conn = db.get_connection()
-        conn.close()
+        # Verificar la base de datos con una conexión del pool
+        db.ping()
         db_status = 'connected'
     except:
         db_status = 'disconnected'
@@ -58,53 +98,160 @@ def health():
         'timestamp': datetime.now().isoformat()
     })
 
+def encode_cursor(product):
+    """Cursor opaco con la posición (scraped_date, id) del último producto"""
+    raw = f"{product['scraped_date'].isoformat()}|{product['id']}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor):
+    raw = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+    scraped_date, product_id = raw.split('|')
+    return datetime.fromisoformat(scraped_date), int(product_id)
+
+def parse_datetime_arg(name):
+    """Parámetro de fecha ISO 8601 (None si no se envía); ValueError si es inválido"""
+    value = request.args.get(name, None)
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"Invalid '{name}' date (use ISO 8601, e.g. 2024-01-31 or 2024-01-31T12:00:00)")
+
 @app.route('/api/products', methods=['GET'])
+@response_cache.cached
 def get_products():
-    """Obtiene todos los productos scrapeados"""
+    """Obtiene los productos scrapeados, paginados y filtrados en SQL"""
     try:
         # Parámetros de paginación
-        page = request.args.get('page', 1, type=int)
-        limit = request.args.get('limit', 50, type=int)
+        page = max(request.args.get('page', 1, type=int), 1)
+        limit = min(max(request.args.get('limit', 50, type=int), 1), MAX_PAGE_SIZE)
         category = request.args.get('category', None)
+        # count=exact (por defecto), estimate o none
+        count_mode = request.args.get('count', 'exact')
+
+        # Paginación por cursor si se envía ?cursor= (vacío para la primera página)
+        cursor = request.args.get('cursor', None)
+        after = None
+        if cursor:
+            try:
+                after = decode_cursor(cursor)
+            except Exception:
+                return jsonify({
+                    'success': False,
+                    'error': 'Invalid cursor'
+                }), 400
+
+        if SNAPSHOT_MODE and cursor is None:
+            snapshot = snapshots.get(RESULTS_JSON)
+            if snapshot is not None:
+                rows = snapshot.by_category.get(category, []) if category else snapshot.data
+                start = (page - 1) * limit
+                return jsonify({
+                    'success': True,
+                    'total': len(rows),
+                    'limit': limit,
+                    'has_more': start + limit < len(rows),
+                    'next_cursor': None,
+                    'data': rows[start:start + limit],
+                    'page': page
+                })
+
+        # Se pide un registro extra para saber si hay página siguiente
+        products = db.get_products_page(
+            category=category,
+            limit=limit + 1,
+            offset=(page - 1) * limit,
+            after=after
+        )
+        has_more = len(products) > limit
+        products = products[:limit]
+
+        next_cursor = encode_cursor(products[-1]) if has_more and products else None
+
+        if count_mode == 'none':
+            total = None
+        else:
+            total = db.count_products(category, estimate=(count_mode == 'estimate'))
         
-        # Obtener datos de la base de datos
-        products = db.get_all_data()
-        
-        # Filtrar por categoría si se especifica
-        if category:
-            products = [p for p in products if p.get('category') == category]
-        
-        # Paginación
-        start = (page - 1) * limit
-        end = start + limit
-        paginated_products = products[start:end]
-        
-        # Convertir datetime a string para JSON
-        for product in paginated_products:
-            if 'scraped_date' in product and product['scraped_date']:
-                product['scraped_date'] = product['scraped_date'].isoformat()
-            if 'last_modified' in product and product['last_modified']:
-                product['last_modified'] = product['last_modified'].isoformat()
-        
+        response = {
+            'success': True,
+            'total': total,
+            'limit': limit,
+            'has_more': has_more,
+            'next_cursor': next_cursor,
+            'data': products
+        }
+        if cursor is None:
+            response['page'] = page
+
+        return jsonify(response)
+    
+    except Exception as e:
+        logger.error(f"Error en /api/products: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+# Sin response_cache: la respuesta informa el tiempo real de la consulta
+# (took_ms) y un cuerpo cacheado repetiría una medición vieja
+@app.route('/api/products/search', methods=['GET'])
+def search_products():
+    """Búsqueda de productos por texto (?q=&category=&page=&limit=), ordenada por relevancia"""
+    try:
+        text = request.args.get('q', '').strip()
+        if not text:
+            return jsonify({
+                'success': False,
+                'error': 'Missing query parameter q'
+            }), 400
+
+        page = max(request.args.get('page', 1, type=int), 1)
+        limit = min(max(request.args.get('limit', 20, type=int), 1), MAX_PAGE_SIZE)
+        category = request.args.get('category', None)
+
+        start = time.perf_counter()
+        # Se pide un registro extra para saber si hay página siguiente
+        products = db.search_products(
+            text,
+            category=category,
+            limit=limit + 1,
+            offset=(page - 1) * limit
+        )
+        took_ms = round((time.perf_counter() - start) * 1000, 2)
+
+        has_more = len(products) > limit
         return jsonify({
             'success': True,
-            'total': len(products),
+            'query': text,
             'page': page,
             'limit': limit,
-            'data': paginated_products
+            'has_more': has_more,
+            'took_ms': took_ms,
+            'data': products[:limit]
         })
     
     except Exception as e:
-        logger.error(f"Error en /api/products: {e}")
+        logger.error(f"Error en /api/products/search: {e}")
         return jsonify({
             'success': False,
             'error': str(e)
         }), 500
 
 @app.route('/api/products/<int:product_id>', methods=['GET'])
+@response_cache.cached
 def get_product(product_id):
     """Obtiene un producto específico por ID"""
     try:
+        if SNAPSHOT_MODE:
+            snapshot = snapshots.get(RESULTS_JSON)
+            if snapshot is not None and product_id in snapshot.by_id:
+                return jsonify({
+                    'success': True,
+                    'data': snapshot.by_id[product_id]
+                })
+
         query = "SELECT * FROM scraped_data WHERE id = %s"
         product = db.execute_query(query, (product_id,), fetch=True)
         
@@ -114,16 +261,9 @@ def get_product(product_id):
                 'error': 'Product not found'
             }), 404
         
-        # Convertir datetime a string
-        product_data = dict(product[0])
-        if 'scraped_date' in product_data and product_data['scraped_date']:
-            product_data['scraped_date'] = product_data['scraped_date'].isoformat()
-        if 'last_modified' in product_data and product_data['last_modified']:
-            product_data['last_modified'] = product_data['last_modified'].isoformat()
-        
         return jsonify({
             'success': True,
-            'data': product_data
+            'data': product[0]
         })
     
     except Exception as e:
@@ -133,19 +273,76 @@ def get_product(product_id):
             'error': str(e)
         }), 500
 
+@app.route('/api/products/<int:product_id>/history', methods=['GET'])
+@response_cache.cached
+def get_product_history(product_id):
+    """Historial de precios de un producto (?from=&to=&bucket=hour|day|week|month)"""
+    try:
+        product = db.execute_query(
+            "SELECT product_key, url FROM scraped_data WHERE id = %s", (product_id,), fetch=True
+        )
+        
+        if not product:
+            return jsonify({
+                'success': False,
+                'error': 'Product not found'
+            }), 404
+        
+        product_key = product[0]['product_key'] or extract_product_key(product[0]['url'])
+        try:
+            start = parse_datetime_arg('from')
+            end = parse_datetime_arg('to')
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+        bucket = request.args.get('bucket', None)
+        limit = min(max(request.args.get('limit', 1000, type=int), 1), 10000)
+        
+        if bucket and bucket not in PRICE_HISTORY_BUCKETS:
+            return jsonify({
+                'success': False,
+                'error': f"Invalid bucket (use {', '.join(PRICE_HISTORY_BUCKETS)})"
+            }), 400
+        
+        if bucket:
+            history = db.get_price_history_buckets(product_key, bucket, start, end, limit)
+        else:
+            history = db.get_price_history(product_key, start, end, limit)
+        
+        return jsonify({
+            'success': True,
+            'product_id': product_id,
+            'product_key': product_key,
+            'bucket': bucket,
+            'total': len(history),
+            'data': history
+        })
+    
+    except Exception as e:
+        logger.error(f"Error obteniendo historial del producto {product_id}: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
 @app.route('/api/files', methods=['GET'])
+@response_cache.cached
 def get_files():
     """Obtiene todos los archivos descargados"""
     try:
+        if SNAPSHOT_MODE:
+            snapshot = snapshots.get(FILES_JSON)
+            if snapshot is not None:
+                return jsonify({
+                    'success': True,
+                    'total': len(snapshot.data),
+                    'data': snapshot.data
+                })
+
         files = db.get_all_files()
         
-        # Convertir datetime a string
-        for file in files:
-            if 'scraped_date' in file and file['scraped_date']:
-                file['scraped_date'] = file['scraped_date'].isoformat()
-            if 'last_modified' in file and file['last_modified']:
-                file['last_modified'] = file['last_modified'].isoformat()
-        
         return jsonify({
             'success': True,
             'total': len(files),
@@ -160,17 +357,25 @@ def get_files():
         }), 500
 
 @app.route('/api/events', methods=['GET'])
+@response_cache.cached
 def get_events():
     """Obtiene los eventos de scraping"""
     try:
         limit = request.args.get('limit', 50, type=int)
+
+        if SNAPSHOT_MODE:
+            snapshot = snapshots.get(EVENTS_JSON)
+            # events.json guarda los últimos 100 eventos
+            if snapshot is not None and limit <= len(snapshot.data):
+                events = snapshot.data[:limit]
+                return jsonify({
+                    'success': True,
+                    'total': len(events),
+                    'data': events
+                })
+
         events = db.get_events(limit)
         
-        # Convertir datetime a string
-        for event in events:
-            if 'event_date' in event and event['event_date']:
-                event['event_date'] = event['event_date'].isoformat()
-        
         return jsonify({
             'success': True,
             'total': len(events),
@@ -185,18 +390,21 @@ def get_events():
         }), 500
 
 @app.route('/api/stats', methods=['GET'])
+@response_cache.cached
 def get_stats():
     """Obtiene estadísticas del scraping"""
     try:
-        # Estadísticas de productos
+        # Estadísticas de productos: suma del resumen por categoría
         query_products = """
         SELECT 
-            COUNT(*) FILTER (WHERE is_active = TRUE) as active_products,
-            COUNT(*) FILTER (WHERE is_active = FALSE) as inactive_products,
-            COUNT(DISTINCT category) as total_categories,
-            AVG(price) as avg_price,
+            COALESCE(SUM(active_products), 0) as active_products,
+            COALESCE(SUM(inactive_products), 0) as inactive_products,
+            COUNT(*) FILTER (WHERE active_products > 0) as total_categories,
+            SUM(price_sum) / NULLIF(SUM(price_count), 0) as avg_price,
+            MIN(price_min) as min_price,
+            MAX(price_max) as max_price,
             MAX(last_modified) as last_scraping
-        FROM scraped_data
+        FROM category_stats
         """
         product_stats = db.execute_query(query_products, fetch=True)[0]
         
@@ -211,36 +419,40 @@ def get_stats():
         """
         file_stats = db.execute_query(query_files, fetch=True)[0]
         
-        # Estadísticas de eventos
-        query_events = """
-        SELECT 
-            COUNT(*) as total_events,
-            COUNT(*) FILTER (WHERE status = 'success') as successful_events,
-            COUNT(*) FILTER (WHERE status = 'error') as failed_events
-        FROM scraping_events
-        WHERE event_date > NOW() - INTERVAL '24 hours'
-        """
-        event_stats = db.execute_query(query_events, fetch=True)[0]
+        # Estadísticas de eventos: contadores diarios
+        event_days = db.get_event_stats(days=7)
+        event_stats = next((day for day in event_days if day['is_today']), {})
         
-        # Convertir Decimal y datetime a tipos serializables
+        # Decimal y datetime los convierte el proveedor JSON de la app
         stats = {
             'products': {
                 'active': product_stats.get('active_products', 0),
                 'inactive': product_stats.get('inactive_products', 0),
                 'categories': product_stats.get('total_categories', 0),
-                'avg_price': float(product_stats.get('avg_price', 0)) if product_stats.get('avg_price') else 0,
-                'last_scraping': product_stats.get('last_scraping').isoformat() if product_stats.get('last_scraping') else None
+                'avg_price': product_stats.get('avg_price') or 0,
+                'min_price': product_stats.get('min_price'),
+                'max_price': product_stats.get('max_price'),
+                'last_scraping': product_stats.get('last_scraping')
             },
             'files': {
                 'total': file_stats.get('total_files', 0),
                 'total_size_mb': round(file_stats.get('total_size', 0) / (1024 * 1024), 2) if file_stats.get('total_size') else 0,
                 'types': file_stats.get('file_types', 0)
             },
-            'events_24h': {
+            'events_today': {
                 'total': event_stats.get('total_events', 0),
                 'successful': event_stats.get('successful_events', 0),
                 'failed': event_stats.get('failed_events', 0)
-            }
+            },
+            'events_7d': [
+                {
+                    'day': day['day'],
+                    'total': day['total_events'],
+                    'successful': day['successful_events'],
+                    'failed': day['failed_events']
+                }
+                for day in event_days
+            ]
         }
         
         return jsonify({
@@ -256,9 +468,18 @@ def get_stats():
         }), 500
 
 @app.route('/api/categories', methods=['GET'])
+@response_cache.cached
 def get_categories():
     """Obtiene todas las categorías disponibles"""
     try:
+        if SNAPSHOT_MODE:
+            snapshot = snapshots.get(RESULTS_JSON)
+            if snapshot is not None:
+                return jsonify({
+                    'success': True,
+                    'data': [category for category in snapshot.by_category if category]
+                })
+
         query = "SELECT DISTINCT category FROM scraped_data WHERE is_active = TRUE"
         categories = db.execute_query(query, fetch=True)
         
@@ -276,6 +497,78 @@ def get_categories():
             'error': str(e)
         }), 500
 
+@app.route('/api/categories/<name>/stats', methods=['GET'])
+@response_cache.cached
+def get_category_stats(name):
+    """Estadísticas de una categoría desde el resumen"""
+    try:
+        stats = db.get_category_stats(name)
+        
+        if not stats:
+            return jsonify({
+                'success': False,
+                'error': 'Category not found'
+            }), 404
+        
+        return jsonify({
+            'success': True,
+            'data': stats[0]
+        })
+    
+    except Exception as e:
+        logger.error(f"Error en /api/categories/{name}/stats: {e}")
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 500
+
+@app.route('/api/snapshots/<name>', methods=['GET'])
+def get_snapshot(name):
+    """Sirve el JSON generado tal cual, con variantes gzip/brotli precomprimidas"""
+    path = SNAPSHOT_FILES.get(name)
+    snapshot = snapshots.get(path) if path else None
+
+    if snapshot is None:
+        return jsonify({
+            'success': False,
+            'error': 'Snapshot not found'
+        }), 404
+
+    encoding = None
+    for candidate in ('br', 'gzip'):
+        if candidate in snapshot.variants and candidate in request.accept_encodings:
+            encoding = candidate
+            break
+
+    response = make_response(snapshot.variants[encoding] if encoding else snapshot.raw)
+    response.mimetype = 'application/json'
+    response.headers['Vary'] = 'Accept-Encoding'
+    response.headers['Cache-Control'] = f'public, max-age={response_cache.client_max_age}, must-revalidate'
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+        response.set_etag(f"{snapshot.etag}-{encoding}")
+    else:
+        response.set_etag(snapshot.etag)
+    return response.make_conditional(request)
+
+@app.route('/api/delta/<artifact>/<filename>', methods=['GET'])
+def get_delta_file(artifact, filename):
+    """Sirve el manifest y los segmentos de la exportación incremental"""
+    if artifact not in DELTA_ARTIFACTS:
+        return jsonify({
+            'success': False,
+            'error': 'Artifact not found'
+        }), 404
+
+    mimetype = 'application/json' if filename.endswith('.json') else 'application/x-ndjson'
+    response = send_from_directory(
+        os.path.abspath(os.path.join(DELTA_DIR, artifact)), filename, mimetype=mimetype
+    )
+    # Los segmentos no cambian una vez escritos; el manifest sí
+    if filename != 'manifest.json':
+        response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
+
 @app.errorhandler(404)
 def not_found(error):
     return jsonify({
@@ -0,0 +1,110 @@
+from collections import OrderedDict
+from functools import wraps
+from flask import request, make_response
+import hashlib
+import threading
+import time
+
+
+class ResponseCache:
+    """Cache en memoria (TTL + LRU) de respuestas JSON de la API"""
+
+    def __init__(self, version_func, maxsize=256, ttl=300, version_interval=5, client_max_age=0):
+        # La versión (último id de scraping_events) forma parte de la clave:
+        # al terminar un scraping las entradas anteriores dejan de usarse
+        self.version_func = version_func
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.version_interval = version_interval
+        # Por defecto el navegador revalida siempre con el ETag (304 barato)
+        self.client_max_age = client_max_age
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = None
+        self._version_checked = 0.0
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def enabled(self):
+        return self.ttl > 0 and self.maxsize > 0
+
+    def current_version(self):
+        """Versión de los datos, consultada como mucho cada `version_interval` segundos"""
+        now = time.monotonic()
+        if now - self._version_checked >= self.version_interval:
+            self._version = self.version_func()
+            self._version_checked = now
+        return self._version
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry['expires'] < time.monotonic():
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def set(self, key, body, mimetype):
+        entry = {
+            'body': body,
+            'mimetype': mimetype,
+            'etag': hashlib.sha1(body).hexdigest(),
+            'expires': time.monotonic() + self.ttl
+        }
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+        return entry
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._version_checked = 0.0
+
+    def stats(self):
+        return {
+            'entries': len(self._entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'version': self._version
+        }
+
+    def cached(self, view):
+        """Decorador para endpoints de lectura: cachea, agrega ETag y responde 304"""
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not self.enabled:
+                return view(*args, **kwargs)
+
+            try:
+                version = self.current_version()
+            except Exception:
+                # Sin versión no se puede invalidar: se responde sin cache
+                return view(*args, **kwargs)
+
+            key = (request.full_path, version)
+            entry = self.get(key)
+
+            if entry is None:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                entry = self.set(key, response.get_data(), response.mimetype)
+
+            response = make_response(entry['body'])
+            response.mimetype = entry['mimetype']
+            response.set_etag(entry['etag'])
+            response.headers['Cache-Control'] = f'public, max-age={self.client_max_age}, must-revalidate'
+            return response.make_conditional(request)
+
+        return wrapper
@@ -0,0 +1,96 @@
+import gzip
+import hashlib
+import os
+import threading
+import time
+from utils.logger import setup_logger
+from utils.serialization import loads
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = setup_logger('snapshot_store')
+
+
+class Snapshot:
+    """Contenido de un JSON generado, ya parseado y precomprimido"""
+
+    def __init__(self, path, raw, stat):
+        self.path = path
+        self.raw = raw
+        self.stat = stat
+        self.data = loads(raw)
+        self.etag = hashlib.sha1(raw).hexdigest()
+
+        # Variantes precomprimidas, calculadas una vez por versión del archivo
+        self.variants = {'gzip': gzip.compress(raw, compresslevel=6)}
+        if brotli is not None:
+            self.variants['br'] = brotli.compress(raw, quality=5)
+
+        # Índices para responder sin recorrer la lista
+        self.by_id = {}
+        self.by_category = {}
+        for row in self.data if isinstance(self.data, list) else []:
+            if 'id' in row:
+                self.by_id[row['id']] = row
+            if 'category' in row:
+                self.by_category.setdefault(row['category'], []).append(row)
+
+
+class SnapshotStore:
+    """Sirve data/*.json desde memoria y los recarga cuando cambian en disco"""
+
+    def __init__(self, paths, check_interval=2):
+        self.paths = list(paths)
+        self.check_interval = check_interval
+        self._snapshots = {}
+        self._checked = {}
+        self._lock = threading.Lock()
+
+    def _stat(self, path):
+        st = os.stat(path)
+        return (st.st_mtime_ns, st.st_size)
+
+    def get(self, path):
+        """Retorna el snapshot vigente del archivo o None si no existe"""
+        now = time.monotonic()
+        current = self._snapshots.get(path)
+
+        if current is not None and now - self._checked.get(path, 0) < self.check_interval:
+            return current
+
+        with self._lock:
+            current = self._snapshots.get(path)
+            self._checked[path] = now
+
+            try:
+                stat = self._stat(path)
+            except OSError:
+                return current
+
+            if current is not None and current.stat == stat:
+                return current
+
+            try:
+                with open(path, 'rb') as f:
+                    raw = f.read()
+                snapshot = Snapshot(path, raw, stat)
+            except Exception as e:
+                # Archivo a medio escribir o inválido: se mantiene la versión anterior
+                logger.warning(f"No se pudo cargar {path}, se mantiene la versión anterior: {e}")
+                return current
+
+            # Reemplazo atómico: las peticiones en curso siguen con la versión previa
+            self._snapshots[path] = snapshot
+            logger.info(f"Snapshot {path} cargado ({len(raw)} bytes)")
+            return snapshot
+
+    def version(self):
+        """Versión conjunta de los snapshots, para invalidar caches"""
+        parts = []
+        for path in self.paths:
+            snapshot = self.get(path)
+            parts.append(snapshot.etag if snapshot else '')
+        return '|'.join(parts)
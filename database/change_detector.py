@@ -0,0 +1,49 @@
+from utils.logger import setup_logger
+
+logger = setup_logger('change_detector')
+
+
+class ChangeDetector:
+    """Índice en memoria product_key -> huella para saltear productos sin cambios"""
+
+    # Se carga una vez por ejecución con una sola lectura de scraped_data.
+    # Los productos cuya huella coincide no se envían a Postgres; los nuevos y
+    # los modificados sí, y el índice se actualiza después de escribirlos.
+
+    def __init__(self, db):
+        self.db = db
+        self.index = {}
+        self.loaded = False
+
+    def load(self):
+        """Carga las huellas de los productos activos"""
+        self.index = dict(self.db.get_product_fingerprints())
+        self.loaded = True
+        logger.info(f"Índice de cambios cargado: {len(self.index)} productos")
+        return len(self.index)
+
+    def classify(self, products):
+        """Separa los productos en nuevos, modificados y sin cambios"""
+        if not self.loaded:
+            self.load()
+
+        # Un producto puede aparecer en varias páginas o términos: gana el último
+        latest = {}
+        for item in products:
+            latest[item['product_key']] = item
+
+        changes = {'new': [], 'changed': [], 'unchanged': []}
+        for key, item in latest.items():
+            known = self.index.get(key)
+            if known is None:
+                changes['new'].append(item)
+            elif known != item['data_hash']:
+                changes['changed'].append(item)
+            else:
+                changes['unchanged'].append(item)
+        return changes
+
+    def apply(self, products):
+        """Registra en el índice los productos ya escritos"""
+        for item in products:
+            self.index[item['product_key']] = item['data_hash']
@@ -1,11 +1,199 @@
 import psycopg2
-from psycopg2.extras import RealDictCursor
+from psycopg2 import pool as pg_pool
+from psycopg2.extras import RealDictCursor, execute_values
 import os
+import time
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
 from dotenv import load_dotenv
 import logging
+from utils.helpers import extract_product_key
 
 load_dotenv()
 
+# Pools compartidos por proceso (scraper, JSONGenerator y API usan el mismo)
+_pools = {}
+_pools_lock = threading.Lock()
+
+# Particiones mensuales de price_history ya verificadas en este proceso
+_price_partitions = set()
+
+# Resoluciones permitidas para agregar el historial de precios
+PRICE_HISTORY_BUCKETS = ('hour', 'day', 'week', 'month')
+
+# Documento de búsqueda: debe coincidir con idx_scraped_data_search para usar el índice
+SEARCH_VECTOR = (
+    "(setweight(to_tsvector('spanish', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('spanish', coalesce(description, '')), 'B'))"
+)
+
+# Actualización de un producto ya conocido: solo si cambió la huella o estaba
+# inactivo, así un upsert repetido no genera escrituras ni mueve last_modified.
+# La categoría es la del primer término que lo encontró: otro término que
+# también lo liste no lo cambia de categoría
+UPSERT_SET = """
+            title = EXCLUDED.title,
+            price = EXCLUDED.price,
+            original_price = EXCLUDED.original_price,
+            discount_percentage = EXCLUDED.discount_percentage,
+            quantity = EXCLUDED.quantity,
+            page_number = EXCLUDED.page_number,
+            url = EXCLUDED.url,
+            image_url = EXCLUDED.image_url,
+            description = EXCLUDED.description,
+            category = COALESCE(scraped_data.category, EXCLUDED.category),
+            data_hash = EXCLUDED.data_hash,
+            is_active = TRUE,
+            missed_runs = 0,
+            last_modified = CURRENT_TIMESTAMP
+        WHERE scraped_data.data_hash IS DISTINCT FROM EXCLUDED.data_hash
+           OR NOT scraped_data.is_active"""
+
+
+class ConnectionPool:
+    """Pool de conexiones thread-safe con health check y espera acotada"""
+
+    # Las conexiones devueltas quedan abiertas en una pila propia hasta
+    # maxconn. ThreadedConnectionPool cierra las que superan minconn al
+    # devolverlas, y con carga concurrente cada checkout extra volvía a
+    # conectar. minconn son las que se abren de entrada.
+
+    def __init__(self, minconn, maxconn, checkout_timeout=30, ping_interval=60, **conn_params):
+        self.minconn = min(minconn, maxconn)
+        self.maxconn = maxconn
+        self.checkout_timeout = checkout_timeout
+        self.ping_interval = ping_interval
+        self.conn_params = conn_params
+        self.logger = logging.getLogger(__name__)
+
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(maxconn)
+        # Pila de (conexión, momento en que se devolvió): se reutiliza la más reciente
+        self._idle = []
+        # Todas las conexiones abiertas por el pool (libres y en uso)
+        self._open = set()
+        self._warmed = False
+
+    def _connect(self):
+        conn = psycopg2.connect(**self.conn_params)
+        with self._lock:
+            self._open.add(conn)
+        return conn
+
+    def _close(self, conn):
+        with self._lock:
+            self._open.discard(conn)
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+    def _warm_up(self):
+        # Se conecta de forma perezosa para no conectar al importar los módulos
+        with self._lock:
+            if self._warmed:
+                return
+            self._warmed = True
+        for _ in range(self.minconn):
+            conn = self._connect()
+            with self._lock:
+                self._idle.append((conn, time.monotonic()))
+
+    def _is_healthy(self, conn, last_used):
+        """Verifica que la conexión siga viva antes de entregarla"""
+        if conn.closed:
+            return False
+
+        # Solo se hace ping si la conexión estuvo inactiva un tiempo
+        if time.monotonic() - last_used < self.ping_interval:
+            return True
+
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _take(self):
+        """Conexión libre de la pila o una nueva (con su momento de último uso)"""
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        # Una conexión recién abierta no necesita ping
+        return self._connect(), time.monotonic()
+
+    def getconn(self):
+        """Obtiene una conexión del pool, esperando si está agotado"""
+        if not self._slots.acquire(timeout=self.checkout_timeout):
+            raise pg_pool.PoolError(
+                f"Pool agotado: no hubo conexión libre en {self.checkout_timeout}s"
+            )
+
+        try:
+            self._warm_up()
+            conn, last_used = self._take()
+            retries = 2
+            # La conexión de reemplazo también se verifica antes de entregarla
+            while not self._is_healthy(conn, last_used):
+                self.logger.warning("Conexión inválida en el pool, reconectando")
+                self._close(conn)
+                if retries == 0:
+                    raise pg_pool.PoolError("No se pudo obtener una conexión válida")
+                retries -= 1
+                conn, last_used = self._take()
+            return conn
+        except Exception:
+            self._slots.release()
+            raise
+
+    def putconn(self, conn, close=False):
+        """Devuelve una conexión al pool"""
+        try:
+            with self._lock:
+                # Una conexión abierta antes de closeall() no vuelve a la pila
+                keep = not close and not conn.closed and conn in self._open
+                if keep:
+                    self._idle.append((conn, time.monotonic()))
+            if not keep:
+                self._close(conn)
+        finally:
+            self._slots.release()
+
+    def closeall(self):
+        """Cierra todas las conexiones del pool"""
+        with self._lock:
+            conns = list(self._open)
+            self._open.clear()
+            self._idle.clear()
+            self._warmed = False
+        for conn in conns:
+            try:
+                conn.close()
+            except psycopg2.Error:
+                pass
+
+
+def get_pool(conn_params, minconn, maxconn, **kwargs):
+    """Retorna el pool compartido para unos parámetros de conexión"""
+    key = tuple(sorted(conn_params.items()))
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = ConnectionPool(minconn, maxconn, **kwargs, **conn_params)
+        return _pools[key]
+
+
+def close_all_pools():
+    """Cierra todos los pools del proceso"""
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.closeall()
+        _pools.clear()
+
+
 class DatabaseManager:
     def __init__(self):
         self.conn_params = {
@@ -15,52 +203,97 @@ class DatabaseManager:
             'user': os.getenv('DB_USER', 'postgres'),
             'password': os.getenv('DB_PASSWORD', '')
         }
+
+        # Timeout por sentencia (ms), aplicado a cada conexión del pool
+        statement_timeout = int(os.getenv('DB_STATEMENT_TIMEOUT', 30000))
+        if statement_timeout > 0:
+            self.conn_params['options'] = f'-c statement_timeout={statement_timeout}'
+
+        self.pool_min = int(os.getenv('DB_POOL_MIN', 1))
+        self.pool_max = int(os.getenv('DB_POOL_MAX', 10))
+        self.pool_timeout = float(os.getenv('DB_POOL_TIMEOUT', 30))
+        self.pool_ping_interval = float(os.getenv('DB_POOL_PING_INTERVAL', 60))
         self.logger = logging.getLogger(__name__)
-    
+
+    @property
+    def pool(self):
+        return get_pool(
+            self.conn_params,
+            self.pool_min,
+            self.pool_max,
+            checkout_timeout=self.pool_timeout,
+            ping_interval=self.pool_ping_interval
+        )
+
     def get_connection(self):
-        """Obtiene una conexión a la base de datos"""
+        """Obtiene una conexión nueva a la base de datos (fuera del pool)"""
         try:
             conn = psycopg2.connect(**self.conn_params)
             return conn
         except Exception as e:
             self.logger.error(f"Error conectando a la base de datos: {e}")
             raise
-    
+
+    @contextmanager
+    def connection(self):
+        """Toma una conexión del pool; hace commit al salir o rollback si falla"""
+        try:
+            conn = self.pool.getconn()
+        except Exception as e:
+            self.logger.error(f"Error conectando a la base de datos: {e}")
+            raise
+
+        broken = False
+        try:
+            yield conn
+            conn.commit()
+        except Exception:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                broken = True
+            raise
+        finally:
+            self.pool.putconn(conn, close=broken or bool(conn.closed))
+
     def execute_query(self, query, params=None, fetch=False):
         """Ejecuta una consulta SQL"""
-        conn = None
-        cursor = None
         try:
-            conn = self.get_connection()
-            cursor = conn.cursor(cursor_factory=RealDictCursor)
-            cursor.execute(query, params)
-            
-            if fetch:
-                result = cursor.fetchall()
-                conn.close()
-                return result
-            else:
-                conn.commit()
-                conn.close()
-                return cursor.rowcount
+            with self.connection() as conn:
+                with conn.cursor(cursor_factory=RealDictCursor) as cursor:
+                    cursor.execute(query, params)
+
+                    if fetch:
+                        return cursor.fetchall()
+                    return cursor.rowcount
         except Exception as e:
-            if conn:
-                conn.rollback()
-                conn.close()
             self.logger.error(f"Error ejecutando query: {e}")
             raise
-    
+
+    def iter_query(self, query, params=None, itersize=2000):
+        """Recorre un resultado grande con un cursor del lado del servidor"""
+        with self.connection() as conn:
+            name = f"stream_{uuid.uuid4().hex}"
+            with conn.cursor(name=name, cursor_factory=RealDictCursor) as cursor:
+                cursor.itersize = itersize
+                cursor.execute(query, params)
+                for row in cursor:
+                    yield row
+
+    def ping(self):
+        """Verifica la conexión con la base de datos"""
+        self.execute_query("SELECT 1", fetch=True)
+        return True
+
     def insert_scraped_data(self, data):
         """Inserta datos scrapeados en la base de datos"""
-        query = """
+        query = f"""
         INSERT INTO scraped_data 
         (title, price, original_price, discount_percentage, quantity, 
-         page_number, url, image_url, description, category, data_hash)
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-        ON CONFLICT (data_hash) 
-        DO UPDATE SET 
-            price = EXCLUDED.price,
-            last_modified = CURRENT_TIMESTAMP
+         page_number, url, image_url, description, category, product_key, data_hash)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+        ON CONFLICT (product_key) 
+        DO UPDATE SET {UPSERT_SET}
         RETURNING id;
         """
         params = (
@@ -74,10 +307,408 @@ class DatabaseManager:
             data.get('image_url'),
             data.get('description'),
             data.get('category'),
+            data.get('product_key'),
             data.get('data_hash')
         )
         return self.execute_query(query, params)
     
+    def _product_row(self, data):
+        """Valida y normaliza un producto para el INSERT; ValueError si no sirve"""
+        def number(field, cast):
+            value = data.get(field)
+            if value is None or value == '':
+                return None
+            value = cast(value)
+            # DECIMAL(10, 2) admite hasta 99.999.999,99
+            if abs(value) >= 10 ** 8:
+                raise ValueError(f"{field} fuera de rango: {value}")
+            return value
+
+        title = (data.get('title') or '').strip()
+        if not title:
+            raise ValueError("producto sin título")
+        if not data.get('product_key'):
+            raise ValueError("producto sin product_key")
+
+        return (
+            title[:500],
+            number('price', float),
+            number('original_price', float),
+            number('discount_percentage', int),
+            number('quantity', int),
+            number('page_number', int),
+            data.get('url'),
+            data.get('image_url'),
+            data.get('description'),
+            (data.get('category') or '')[:200] or None,
+            str(data['product_key'])[:200],
+            data.get('data_hash')
+        )
+
+    def insert_scraped_data_batch(self, products, page_size=500):
+        """Inserta/actualiza un lote de productos y retorna los conteos por fila"""
+        # Una misma clave no puede aparecer dos veces en el mismo INSERT ... ON CONFLICT
+        unique = {}
+        for data in products:
+            unique[data.get('product_key')] = data
+
+        # Las filas inválidas se descartan antes del lote para no abortarlo entero
+        rows = {}
+        failed = []
+        for key, data in unique.items():
+            try:
+                rows[key] = self._product_row(data)
+            except (TypeError, ValueError) as e:
+                self.logger.warning(f"Producto descartado ({key}): {e}")
+                failed.append(key)
+
+        if not rows:
+            return {'inserted': 0, 'updated': 0, 'failed': failed}
+
+        query = f"""
+        INSERT INTO scraped_data
+        (title, price, original_price, discount_percentage, quantity,
+         page_number, url, image_url, description, category, product_key, data_hash)
+        VALUES %s
+        ON CONFLICT (product_key)
+        DO UPDATE SET {UPSERT_SET}
+        RETURNING (xmax = 0) AS inserted;
+        """
+
+        try:
+            with self.connection() as conn:
+                with conn.cursor() as cursor:
+                    results = execute_values(cursor, query, list(rows.values()), page_size=page_size, fetch=True)
+        except (psycopg2.DataError, psycopg2.IntegrityError) as e:
+            # Un dato que la validación no detectó: se reintenta fila por fila
+            self.logger.error(f"Error insertando lote de productos, se reintenta fila por fila: {e}")
+            return self._insert_products_by_row(rows, failed)
+        except Exception as e:
+            self.logger.error(f"Error insertando lote de productos: {e}")
+            raise
+
+        inserted = sum(1 for (was_inserted,) in results if was_inserted)
+        return {'inserted': inserted, 'updated': len(results) - inserted, 'failed': failed}
+
+    def _insert_products_by_row(self, rows, failed):
+        """Inserta cada fila con su propio savepoint y registra las que fallan"""
+        query = f"""
+        INSERT INTO scraped_data
+        (title, price, original_price, discount_percentage, quantity,
+         page_number, url, image_url, description, category, product_key, data_hash)
+        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+        ON CONFLICT (product_key)
+        DO UPDATE SET {UPSERT_SET}
+        RETURNING (xmax = 0) AS inserted;
+        """
+        counts = {'inserted': 0, 'updated': 0, 'failed': failed}
+
+        with self.connection() as conn:
+            with conn.cursor() as cursor:
+                for key, row in rows.items():
+                    cursor.execute("SAVEPOINT product_row")
+                    try:
+                        cursor.execute(query, row)
+                        result = cursor.fetchone()
+                    except (psycopg2.DataError, psycopg2.IntegrityError) as e:
+                        cursor.execute("ROLLBACK TO SAVEPOINT product_row")
+                        self.logger.warning(f"Producto descartado ({key}): {e}")
+                        failed.append(key)
+                        continue
+                    cursor.execute("RELEASE SAVEPOINT product_row")
+                    if result is not None:
+                        counts['inserted' if result[0] else 'updated'] += 1
+
+        return counts
+
+    def reconcile_products(self, categories, seen_keys, max_missed_runs=3):
+        """Desactiva los productos que no aparecieron en las últimas N ejecuciones de su categoría"""
+        if not categories:
+            return {'reset': 0, 'deactivated': 0}
+
+        # Los vistos en esta ejecución vuelven a cero (normalmente muy pocas filas)
+        reset_query = """
+        UPDATE scraped_data SET missed_runs = 0
+        WHERE missed_runs > 0 AND product_key = ANY(%s)
+        """
+        # Un solo UPDATE para los no vistos: suma una ausencia y desactiva al
+        # llegar al límite. last_modified solo se mueve al desactivar, para que
+        # la exportación incremental lo publique
+        sweep_query = """
+        UPDATE scraped_data SET
+            missed_runs = missed_runs + 1,
+            is_active = missed_runs + 1 < %(limit)s,
+            last_modified = CASE
+                WHEN missed_runs + 1 >= %(limit)s THEN CURRENT_TIMESTAMP
+                ELSE last_modified
+            END
+        WHERE is_active = TRUE
+          AND category = ANY(%(categories)s)
+          AND NOT (product_key = ANY(%(seen)s))
+        RETURNING is_active
+        """
+        seen = list(seen_keys)
+
+        try:
+            with self.connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute(reset_query, (seen,))
+                    reset = cursor.rowcount
+                    cursor.execute(sweep_query, {
+                        'limit': max_missed_runs,
+                        'categories': list(categories),
+                        'seen': seen
+                    })
+                    deactivated = sum(1 for (active,) in cursor.fetchall() if not active)
+        except Exception as e:
+            self.logger.error(f"Error reconciliando productos: {e}")
+            raise
+
+        return {'reset': reset, 'deactivated': deactivated}
+
+    def archive_inactive(self, older_than_days=30, batch_size=5000):
+        """Mueve a scraped_data_archive los productos inactivos hace más de N días"""
+        query = """
+        WITH moved AS (
+            DELETE FROM scraped_data
+            WHERE id IN (
+                SELECT id FROM scraped_data
+                WHERE is_active = FALSE
+                  AND last_modified < CURRENT_TIMESTAMP - %s * INTERVAL '1 day'
+                LIMIT %s
+            )
+            RETURNING *
+        )
+        INSERT INTO scraped_data_archive
+        SELECT moved.*, CURRENT_TIMESTAMP FROM moved
+        """
+        total = 0
+        try:
+            # Lotes cortos: cada uno es su propia transacción y no bloquea la tabla
+            while True:
+                with self.connection() as conn:
+                    with conn.cursor() as cursor:
+                        cursor.execute(query, (older_than_days, batch_size))
+                        moved = cursor.rowcount
+                total += moved
+                if moved < batch_size:
+                    break
+        except Exception as e:
+            self.logger.error(f"Error archivando productos inactivos: {e}")
+            raise
+
+        return total
+
+    def refresh_category_stats(self):
+        """Recalcula desde cero el resumen de todas las categorías"""
+        # Los triggers lo mantienen al día; esto corrige cualquier desvío y lo
+        # corre solo el job de archivado. SHARE frena a los escritores mientras
+        # tanto: un delta aplicado a mitad del recálculo se perdería
+        lock = "LOCK TABLE scraped_data IN SHARE MODE"
+        query = """
+        INSERT INTO category_stats
+        (category, active_products, inactive_products, price_count, price_sum,
+         price_min, price_max, last_modified, refreshed_at)
+        SELECT
+            category,
+            COUNT(*) FILTER (WHERE is_active),
+            COUNT(*) FILTER (WHERE NOT is_active),
+            COUNT(price) FILTER (WHERE is_active),
+            COALESCE(SUM(price) FILTER (WHERE is_active), 0),
+            MIN(price) FILTER (WHERE is_active),
+            MAX(price) FILTER (WHERE is_active),
+            MAX(last_modified),
+            CURRENT_TIMESTAMP
+        FROM scraped_data
+        WHERE category IS NOT NULL
+        GROUP BY category
+        ON CONFLICT (category) DO UPDATE SET
+            active_products = EXCLUDED.active_products,
+            inactive_products = EXCLUDED.inactive_products,
+            price_count = EXCLUDED.price_count,
+            price_sum = EXCLUDED.price_sum,
+            price_min = EXCLUDED.price_min,
+            price_max = EXCLUDED.price_max,
+            last_modified = EXCLUDED.last_modified,
+            refreshed_at = EXCLUDED.refreshed_at
+        """
+        # Categorías que ya no tienen filas (p. ej. todo archivado)
+        cleanup = """
+        DELETE FROM category_stats
+        WHERE NOT EXISTS (
+            SELECT 1 FROM scraped_data d WHERE d.category = category_stats.category
+        )
+        """
+
+        try:
+            with self.connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute(lock)
+                    cursor.execute(query)
+                    refreshed = cursor.rowcount
+                    cursor.execute(cleanup)
+        except Exception as e:
+            self.logger.error(f"Error actualizando resumen de categorías: {e}")
+            raise
+
+        return refreshed
+
+    def get_category_stats(self, category=None):
+        """Lee el resumen de una categoría o de todas"""
+        query = """
+        SELECT category, active_products, inactive_products, price_count,
+               CASE WHEN price_count > 0 THEN price_sum / price_count END AS avg_price,
+               price_min, price_max, last_modified, refreshed_at
+        FROM category_stats
+        """
+        if category is not None:
+            return self.execute_query(query + " WHERE category = %s", (category,), fetch=True)
+        return self.execute_query(query + " ORDER BY category", fetch=True)
+
+    def get_event_stats(self, days=7):
+        """Contadores diarios de eventos de los últimos N días"""
+        # "Hoy" lo define la BD, en la misma zona horaria con la que log_event
+        # agrupa los eventos por día
+        query = """
+        SELECT day, total_events, successful_events, failed_events,
+               day = CURRENT_DATE AS is_today
+        FROM daily_event_stats
+        WHERE day > CURRENT_DATE - %s
+        ORDER BY day DESC
+        """
+        return self.execute_query(query, (days,), fetch=True)
+
+    def get_change_rate(self, category, since):
+        """Fracción de productos activos de la categoría que cambiaron desde `since`"""
+        # last_modified solo se mueve cuando cambia la huella (o al desactivar).
+        # Numerador y denominador sobre los mismos activos: la tasa queda en
+        # [0, 1]. `since` debe venir de now(), el reloj de la BD
+        query = """
+        SELECT
+            COUNT(*) FILTER (WHERE last_modified >= %s) AS changed,
+            COUNT(*) AS active
+        FROM scraped_data
+        WHERE category = %s AND is_active
+        """
+        row = self.execute_query(query, (since, category), fetch=True)[0]
+        if not row['active']:
+            return None
+        return row['changed'] / row['active']
+
+    def get_product_fingerprints(self, itersize=10000):
+        """Itera (product_key, data_hash) de los productos activos"""
+        query = """
+        SELECT product_key, data_hash FROM scraped_data
+        WHERE is_active = TRUE AND product_key IS NOT NULL
+        """
+        for row in self.iter_query(query, itersize=itersize):
+            yield row['product_key'], row['data_hash']
+
+    def ensure_price_partition(self, when=None):
+        """Crea (si faltan) las particiones de price_history del mes de una fecha y del siguiente"""
+        # El mes sale del reloj de la BD: observed_at es su CURRENT_TIMESTAMP
+        # (hora local de la sesión, sin zona). El siguiente se crea por
+        # adelantado: si sus filas llegaran antes a price_history_default, la
+        # partición del mes ya no se podría crear
+        when = when or self.now().replace(tzinfo=None)
+        start = when.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        following = self._next_month(start)
+        for month in (start, following):
+            if month not in _price_partitions:
+                self._create_price_partition(month)
+
+    @staticmethod
+    def _next_month(start):
+        return start.replace(year=start.year + 1, month=1) if start.month == 12 else start.replace(month=start.month + 1)
+
+    def _create_price_partition(self, start):
+        end = self._next_month(start)
+        query = f"""
+        CREATE TABLE IF NOT EXISTS price_history_{start:%Y_%m}
+        PARTITION OF price_history
+        FOR VALUES FROM ('{start:%Y-%m-%d}') TO ('{end:%Y-%m-%d}');
+        """
+        try:
+            self.execute_query(query)
+        except Exception as e:
+            # Sin partición propia las filas caen en price_history_default; se
+            # reintenta en la próxima escritura
+            self.logger.warning(f"No se pudo crear la partición price_history_{start:%Y_%m}: {e}")
+            return
+        _price_partitions.add(start)
+    
+    def insert_price_history_batch(self, products, page_size=500):
+        """Agrega al historial los precios que cambiaron respecto de la última observación"""
+        latest = {}
+        for data in products:
+            key = data.get('product_key') or extract_product_key(data.get('url'))
+            if key and data.get('price') is not None:
+                latest[key] = (key, data.get('price'), data.get('category'))
+
+        if not latest:
+            return 0
+
+        self.ensure_price_partition()
+
+        # Solo se agrega una fila cuando el precio difiere del último registrado
+        query = """
+        INSERT INTO price_history (product_key, price, category, observed_at)
+        SELECT v.product_key, v.price, v.category, CURRENT_TIMESTAMP
+        FROM (VALUES %s) AS v(product_key, price, category)
+        WHERE v.price IS DISTINCT FROM (
+            SELECT h.price FROM price_history h
+            WHERE h.product_key = v.product_key
+            ORDER BY h.observed_at DESC
+            LIMIT 1
+        )
+        """
+        try:
+            with self.connection() as conn:
+                with conn.cursor() as cursor:
+                    execute_values(
+                        cursor, query, list(latest.values()),
+                        template="(%s, %s::numeric, %s)", page_size=page_size
+                    )
+                    return cursor.rowcount
+        except Exception as e:
+            self.logger.error(f"Error insertando historial de precios: {e}")
+            raise
+    
+    def get_price_history(self, product_key, start=None, end=None, limit=1000):
+        """Obtiene los cambios de precio de un producto en un rango de fechas"""
+        query = """
+        SELECT price, observed_at FROM price_history
+        WHERE product_key = %s
+          AND observed_at >= COALESCE(%s::timestamp, '-infinity')
+          AND observed_at < COALESCE(%s::timestamp, 'infinity')
+        ORDER BY observed_at DESC
+        LIMIT %s
+        """
+        return self.execute_query(query, (product_key, start, end, limit), fetch=True)
+    
+    def get_price_history_buckets(self, product_key, bucket='day', start=None, end=None, limit=1000):
+        """Historial agregado por hora/día/semana/mes (mínimo, máximo, promedio y último)"""
+        if bucket not in PRICE_HISTORY_BUCKETS:
+            raise ValueError(f"Resolución inválida: {bucket}")
+
+        query = """
+        SELECT
+            date_trunc(%s, observed_at) AS bucket,
+            MIN(price) AS min_price,
+            MAX(price) AS max_price,
+            AVG(price) AS avg_price,
+            (array_agg(price ORDER BY observed_at DESC))[1] AS last_price,
+            COUNT(*) AS changes
+        FROM price_history
+        WHERE product_key = %s
+          AND observed_at >= COALESCE(%s::timestamp, '-infinity')
+          AND observed_at < COALESCE(%s::timestamp, 'infinity')
+        GROUP BY 1
+        ORDER BY 1 DESC
+        LIMIT %s
+        """
+        return self.execute_query(query, (bucket, product_key, start, end, limit), fetch=True)
+    
     def insert_file(self, file_data):
         """Inserta información de archivo descargado"""
         query = """
@@ -102,11 +733,23 @@ class DatabaseManager:
     def log_event(self, event_type, description, affected_records=0, 
                   execution_time=0, status='success', error_message=None):
         """Registra un evento de scraping"""
+        # El evento y su contador diario se escriben en la misma sentencia
         query = """
-        INSERT INTO scraping_events 
-        (event_type, event_description, affected_records, execution_time, status, error_message)
-        VALUES (%s, %s, %s, %s, %s, %s)
-        RETURNING id;
+        WITH event AS (
+            INSERT INTO scraping_events 
+            (event_type, event_description, affected_records, execution_time, status, error_message)
+            VALUES (%s, %s, %s, %s, %s, %s)
+            RETURNING id, status, event_date
+        ), counters AS (
+            INSERT INTO daily_event_stats (day, total_events, successful_events, failed_events)
+            SELECT event_date::date, 1, (status = 'success')::int, (status = 'error')::int
+            FROM event
+            ON CONFLICT (day) DO UPDATE SET
+                total_events = daily_event_stats.total_events + EXCLUDED.total_events,
+                successful_events = daily_event_stats.successful_events + EXCLUDED.successful_events,
+                failed_events = daily_event_stats.failed_events + EXCLUDED.failed_events
+        )
+        SELECT id FROM event;
         """
         params = (event_type, description, affected_records, execution_time, status, error_message)
         return self.execute_query(query, params)
@@ -116,11 +759,96 @@ class DatabaseManager:
         query = "SELECT * FROM scraped_data WHERE is_active = TRUE ORDER BY scraped_date DESC"
         return self.execute_query(query, fetch=True)
     
+    def get_products_page(self, category=None, limit=50, offset=0, after=None):
+        """Obtiene una página de productos activos (OFFSET o cursor `after` = (scraped_date, id))"""
+        conditions = ["is_active = TRUE"]
+        params = []
+
+        if category:
+            conditions.append("category = %s")
+            params.append(category)
+
+        if after is not None:
+            conditions.append("(scraped_date, id) < (%s, %s)")
+            params.extend(after)
+            offset = 0
+
+        query = f"""
+        SELECT * FROM scraped_data
+        WHERE {' AND '.join(conditions)}
+        ORDER BY scraped_date DESC, id DESC
+        LIMIT %s OFFSET %s
+        """
+        params.extend([limit, offset])
+        return self.execute_query(query, tuple(params), fetch=True)
+
+    def count_products(self, category=None, estimate=False):
+        """Cuenta productos activos; con estimate=True usa la estimación del planner"""
+        where = "WHERE is_active = TRUE"
+        params = ()
+        if category:
+            where += " AND category = %s"
+            params = (category,)
+
+        if estimate:
+            # Filas estimadas por el planner: no recorre la tabla
+            plan = self.execute_query(
+                f"EXPLAIN (FORMAT JSON) SELECT 1 FROM scraped_data {where}", params, fetch=True
+            )
+            return int(plan[0]['QUERY PLAN'][0]['Plan']['Plan Rows'])
+
+        query = f"SELECT COUNT(*) AS total FROM scraped_data {where}"
+        return self.execute_query(query, params, fetch=True)[0]['total']
+
+    def search_products(self, text, category=None, limit=20, offset=0):
+        """Búsqueda por texto completo (español) con respaldo por trigramas"""
+        # El texto completo cubre palabras y sus variantes (notebooks -> notebook);
+        # word_similarity (<%) encuentra el título aunque la consulta tenga errores
+        conditions = [
+            "is_active = TRUE",
+            f"({SEARCH_VECTOR} @@ query.tsq OR %(text)s <%% title)"
+        ]
+        params = {'text': text, 'limit': limit, 'offset': offset}
+        if category:
+            conditions.append("category = %(category)s")
+            params['category'] = category
+
+        query = f"""
+        SELECT scraped_data.*,
+               ts_rank_cd({SEARCH_VECTOR}, query.tsq) AS rank,
+               word_similarity(%(text)s, title) AS similarity
+        FROM scraped_data,
+             websearch_to_tsquery('spanish', %(text)s) AS query(tsq)
+        WHERE {' AND '.join(conditions)}
+        ORDER BY rank DESC, similarity DESC, id DESC
+        LIMIT %(limit)s OFFSET %(offset)s
+        """
+        return self.execute_query(query, params, fetch=True)
+
+    def iter_all_data(self, itersize=2000):
+        """Itera los datos activos sin cargarlos todos en memoria"""
+        query = "SELECT * FROM scraped_data WHERE is_active = TRUE ORDER BY scraped_date DESC"
+        return self.iter_query(query, itersize=itersize)
+    
+    def iter_all_files(self, itersize=2000):
+        """Itera los archivos activos sin cargarlos todos en memoria"""
+        query = "SELECT * FROM scraped_files WHERE is_active = TRUE ORDER BY scraped_date DESC"
+        return self.iter_query(query, itersize=itersize)
+    
     def get_all_files(self):
         """Obtiene todos los archivos activos"""
         query = "SELECT * FROM scraped_files WHERE is_active = TRUE ORDER BY scraped_date DESC"
         return self.execute_query(query, fetch=True)
     
+    def now(self):
+        """Hora actual de la BD, la misma referencia que last_modified y finished_at"""
+        return self.execute_query("SELECT CURRENT_TIMESTAMP AS now", fetch=True)[0]['now']
+    
+    def get_latest_event_id(self):
+        """Id del último evento registrado (cambia al terminar cada scraping)"""
+        query = "SELECT MAX(id) AS last_id FROM scraping_events"
+        return self.execute_query(query, fetch=True)[0]['last_id']
+    
     def get_events(self, limit=50):
         """Obtiene los últimos eventos"""
         query = "SELECT * FROM scraping_events ORDER BY event_date DESC LIMIT %s"
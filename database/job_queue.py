@@ -0,0 +1,259 @@
+import threading
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from psycopg2.extras import execute_values
+from utils.logger import setup_logger
+from utils.serialization import dumps
+
+logger = setup_logger('job_queue')
+
+JOB_TYPES = ('listing', 'static')
+
+
+class LeaseSet:
+    """Trabajos en curso de un worker, renovados juntos por un solo heartbeat"""
+
+    # Un trabajo entra al reclamarlo y sale al completarlo o fallarlo; mientras
+    # tanto leased() lo renueva aunque ya no lo esté procesando el crawler
+
+    def __init__(self):
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def add(self, jobs):
+        with self._lock:
+            for job in jobs:
+                self._jobs[job['id']] = job
+
+    def discard(self, job):
+        with self._lock:
+            self._jobs.pop(job['id'], None)
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self._jobs.values()))
+
+    def __len__(self):
+        with self._lock:
+            return len(self._jobs)
+
+
+class JobQueue:
+    """Cola de trabajos de scraping en Postgres (crawl_runs / crawl_jobs)"""
+
+    # Varios procesos main.py reclaman trabajos con FOR UPDATE SKIP LOCKED: cada
+    # fila la toma un solo worker y nadie espera por los locks de otro. El lease
+    # se renueva con heartbeats; si un worker muere, su trabajo vuelve a estar
+    # disponible al vencer el lease, hasta agotar max_attempts.
+
+    def __init__(self, db, lease_seconds=120, max_attempts=3, retry_delay=30):
+        self.db = db
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+
+    def enqueue_run(self, search_terms, max_pages, static_urls=()):
+        """Crea una ejecución con un trabajo por página de listado y por URL estática"""
+        run_id = f"{datetime.now():%Y%m%d%H%M%S}-{uuid.uuid4().hex[:8]}"
+
+        # Primero la página 1 de cada término, como en el crawl local
+        jobs = [
+            (run_id, 'listing', term, page_number, self.max_attempts)
+            for page_number in range(1, max_pages + 1)
+            for term in search_terms
+        ]
+        jobs.extend((run_id, 'static', url, None, self.max_attempts) for url in static_urls)
+
+        try:
+            with self.db.connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute("INSERT INTO crawl_runs (run_id) VALUES (%s)", (run_id,))
+                    execute_values(cursor, """
+                    INSERT INTO crawl_jobs (run_id, job_type, target, page_number, max_attempts)
+                    VALUES %s
+                    """, jobs)
+        except Exception as e:
+            logger.error(f"Error encolando la ejecución {run_id}: {e}")
+            raise
+
+        logger.info(f"Ejecución {run_id} encolada con {len(jobs)} trabajos")
+        return run_id
+
+    def _reap_expired(self):
+        """Marca como fallidos los trabajos con lease vencido y sin reintentos"""
+        query = """
+        UPDATE crawl_jobs SET
+            status = 'failed',
+            finished_at = CURRENT_TIMESTAMP,
+            last_error = COALESCE(last_error, 'lease vencido')
+        WHERE status = 'running'
+          AND lease_until < CURRENT_TIMESTAMP
+          AND attempts >= max_attempts
+        """
+        return self.db.execute_query(query)
+
+    def claim(self, worker_id, job_type, limit=1):
+        """Reclama hasta `limit` trabajos pendientes o con lease vencido"""
+        self._reap_expired()
+        query = """
+        WITH candidates AS (
+            SELECT id FROM crawl_jobs
+            WHERE job_type = %(job_type)s
+              AND status IN ('pending', 'running')
+              AND (
+                  (status = 'pending' AND available_at <= CURRENT_TIMESTAMP)
+                  OR (status = 'running' AND lease_until < CURRENT_TIMESTAMP)
+              )
+              AND attempts < max_attempts
+            ORDER BY available_at, id
+            LIMIT %(limit)s
+            FOR UPDATE SKIP LOCKED
+        )
+        UPDATE crawl_jobs j SET
+            status = 'running',
+            worker_id = %(worker_id)s,
+            attempts = j.attempts + 1,
+            lease_until = CURRENT_TIMESTAMP + %(lease)s * INTERVAL '1 second',
+            heartbeat_at = CURRENT_TIMESTAMP
+        FROM candidates
+        WHERE j.id = candidates.id
+        RETURNING j.*
+        """
+        params = {
+            'job_type': job_type,
+            'limit': limit,
+            'worker_id': worker_id,
+            'lease': self.lease_seconds
+        }
+        return self.db.execute_query(query, params, fetch=True)
+
+    def heartbeat(self, jobs, worker_id):
+        """Extiende el lease de los trabajos en curso de este worker"""
+        query = """
+        UPDATE crawl_jobs SET
+            lease_until = CURRENT_TIMESTAMP + %s * INTERVAL '1 second',
+            heartbeat_at = CURRENT_TIMESTAMP
+        WHERE id = ANY(%s) AND worker_id = %s AND status = 'running'
+        """
+        ids = [job['id'] for job in jobs]
+        if not ids:
+            return 0
+        return self.db.execute_query(query, (self.lease_seconds, ids, worker_id))
+
+    @contextmanager
+    def leased(self, jobs, worker_id):
+        """Renueva el lease en segundo plano mientras se procesan los trabajos"""
+        # jobs puede ser un LeaseSet: cada heartbeat toma los trabajos actuales
+        stop = threading.Event()
+
+        def beat():
+            while not stop.wait(self.lease_seconds / 3):
+                try:
+                    self.heartbeat(jobs, worker_id)
+                except Exception as e:
+                    logger.warning(f"Error renovando lease: {e}")
+
+        thread = threading.Thread(target=beat, name='job-heartbeat', daemon=True)
+        thread.start()
+        try:
+            yield jobs
+        finally:
+            stop.set()
+            thread.join()
+
+    def complete(self, job, result=None):
+        """Marca el trabajo como terminado; falso si el lease ya lo tomó otro worker"""
+        query = """
+        UPDATE crawl_jobs SET
+            status = 'done',
+            result = %s::jsonb,
+            lease_until = NULL,
+            finished_at = CURRENT_TIMESTAMP
+        WHERE id = %s AND worker_id = %s AND status = 'running'
+        """
+        payload = dumps(result).decode('utf-8') if result is not None else None
+        updated = self.db.execute_query(query, (payload, job['id'], job['worker_id']))
+        if not updated:
+            logger.warning(f"Trabajo {job['id']} ya no pertenece a {job['worker_id']}")
+        return bool(updated)
+
+    def fail(self, job, error):
+        """Devuelve el trabajo a la cola con backoff exponencial o lo marca fallido"""
+        query = """
+        UPDATE crawl_jobs SET
+            status = CASE WHEN attempts < max_attempts THEN 'pending' ELSE 'failed' END,
+            available_at = CURRENT_TIMESTAMP + %s * power(2, attempts - 1) * INTERVAL '1 second',
+            finished_at = CASE WHEN attempts < max_attempts THEN NULL ELSE CURRENT_TIMESTAMP END,
+            lease_until = NULL,
+            last_error = %s
+        WHERE id = %s AND worker_id = %s AND status = 'running'
+        """
+        return self.db.execute_query(query, (self.retry_delay, str(error), job['id'], job['worker_id']))
+
+    def skip_after(self, job):
+        """Página sin resultados: las siguientes del mismo término no se visitan"""
+        query = """
+        UPDATE crawl_jobs SET status = 'skipped', finished_at = CURRENT_TIMESTAMP
+        WHERE run_id = %s AND job_type = 'listing' AND target = %s
+          AND page_number > %s AND status = 'pending'
+        """
+        return self.db.execute_query(query, (job['run_id'], job['target'], job['page_number']))
+
+    def claim_finished_runs(self):
+        """Toma (una sola vez) las ejecuciones sin trabajos pendientes ni en curso"""
+        self._reap_expired()
+        query = """
+        UPDATE crawl_runs r SET finalized_at = CURRENT_TIMESTAMP
+        WHERE finalized_at IS NULL
+          AND NOT EXISTS (
+              SELECT 1 FROM crawl_jobs j
+              WHERE j.run_id = r.run_id AND j.status IN ('pending', 'running')
+          )
+        RETURNING run_id
+        """
+        return [row['run_id'] for row in self.db.execute_query(query, fetch=True)]
+
+    def run_results(self, run_id):
+        """Productos vistos y términos recorridos sin fallas en una ejecución"""
+        keys_query = """
+        SELECT DISTINCT jsonb_array_elements_text(result->'keys') AS product_key
+        FROM crawl_jobs
+        WHERE run_id = %s AND job_type = 'listing' AND status = 'done'
+        """
+        # Un término con páginas fallidas no se reconcilia: faltarían productos.
+        # Tampoco uno con la página 1 vacía: no alcanza para desactivar la categoría
+        terms_query = """
+        SELECT target FROM crawl_jobs
+        WHERE run_id = %s AND job_type = 'listing'
+        GROUP BY target
+        HAVING bool_and(status IN ('done', 'skipped'))
+           AND bool_or(page_number = 1 AND status = 'done' AND (result->>'cards')::int > 0)
+        """
+        keys = {row['product_key'] for row in self.db.execute_query(keys_query, (run_id,), fetch=True)}
+        terms = {row['target'] for row in self.db.execute_query(terms_query, (run_id,), fetch=True)}
+        return keys, terms
+
+    def static_results(self, target, since):
+        """Archivos descargados y modificados de una URL estática desde `since`"""
+        query = """
+        SELECT
+            COALESCE(SUM((result->>'files')::int), 0) AS files,
+            COALESCE(SUM((result->>'changed')::int), 0) AS changed
+        FROM crawl_jobs
+        WHERE job_type = 'static' AND target = %s AND status = 'done' AND finished_at >= %s
+        """
+        return self.db.execute_query(query, (target, since), fetch=True)[0]
+
+    def run_summary(self, run_id):
+        """Cantidad de trabajos por estado en una ejecución"""
+        query = "SELECT status, COUNT(*) AS total FROM crawl_jobs WHERE run_id = %s GROUP BY status"
+        return {row['status']: row['total'] for row in self.db.execute_query(query, (run_id,), fetch=True)}
+
+    def purge_runs(self, older_than_days=7):
+        """Borra las ejecuciones finalizadas hace más de N días (y sus trabajos)"""
+        query = """
+        DELETE FROM crawl_runs
+        WHERE finalized_at < CURRENT_TIMESTAMP - %s * INTERVAL '1 day'
+        """
+        return self.db.execute_query(query, (older_than_days,))
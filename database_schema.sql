@@ -1,7 +1,16 @@
 
+-- Similitud por trigramas para la búsqueda tolerante a errores de tipeo
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
 DROP TABLE IF EXISTS scraped_files CASCADE;
 DROP TABLE IF EXISTS scraped_data CASCADE;
+DROP TABLE IF EXISTS scraped_data_archive CASCADE;
 DROP TABLE IF EXISTS scraping_events CASCADE;
+DROP TABLE IF EXISTS price_history CASCADE;
+DROP TABLE IF EXISTS category_stats CASCADE;
+DROP TABLE IF EXISTS daily_event_stats CASCADE;
+DROP TABLE IF EXISTS crawl_jobs CASCADE;
+DROP TABLE IF EXISTS crawl_runs CASCADE;
 
 -- Tabla principal de datos scrapeados
 CREATE TABLE scraped_data (
@@ -19,7 +28,16 @@ CREATE TABLE scraped_data (
     scraped_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     last_modified TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     is_active BOOLEAN DEFAULT TRUE,
-    data_hash VARCHAR(64) UNIQUE
+    -- Ejecuciones consecutivas de su categoría en las que no apareció
+    missed_runs INTEGER DEFAULT 0,
+    product_key VARCHAR(200) UNIQUE,
+    data_hash VARCHAR(64)
+);
+
+-- Productos inactivos antiguos, fuera del conjunto que leen la API y las exportaciones
+CREATE TABLE scraped_data_archive (
+    LIKE scraped_data,
+    archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
 -- Tabla de archivos descargados
@@ -48,17 +66,180 @@ CREATE TABLE scraping_events (
     event_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
 );
 
+-- Historial de precios (solo agregar), particionado por mes.
+-- product_key es la identidad estable del producto (id de MercadoLibre o URL)
+CREATE TABLE price_history (
+    product_key VARCHAR(200) NOT NULL,
+    price DECIMAL(10, 2) NOT NULL,
+    category VARCHAR(200),
+    observed_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+) PARTITION BY RANGE (observed_at);
+
+-- Las particiones mensuales las crea la aplicación; esta recibe el resto
+CREATE TABLE price_history_default PARTITION OF price_history DEFAULT;
+
+-- Resumen por categoría, mantenido en forma incremental por los triggers de
+-- scraped_data (ver category_stats_apply) y recalculado completo por el job
+-- de archivado
+CREATE TABLE category_stats (
+    category VARCHAR(200) PRIMARY KEY,
+    active_products INTEGER NOT NULL DEFAULT 0,
+    inactive_products INTEGER NOT NULL DEFAULT 0,
+    price_count INTEGER NOT NULL DEFAULT 0,
+    price_sum DECIMAL(16, 2) NOT NULL DEFAULT 0,
+    price_min DECIMAL(10, 2),
+    price_max DECIMAL(10, 2),
+    last_modified TIMESTAMP,
+    refreshed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
+
+-- Contadores diarios de eventos, incrementados al registrar cada evento
+CREATE TABLE daily_event_stats (
+    day DATE PRIMARY KEY,
+    total_events INTEGER NOT NULL DEFAULT 0,
+    successful_events INTEGER NOT NULL DEFAULT 0,
+    failed_events INTEGER NOT NULL DEFAULT 0
+);
+
+-- Cola de trabajo distribuida: cada ejecución (crawl_runs) se divide en
+-- trabajos (página de listado o URL estática) que los workers reclaman con
+-- FOR UPDATE SKIP LOCKED y mantienen con un lease renovado por heartbeat
+CREATE TABLE crawl_runs (
+    run_id VARCHAR(64) PRIMARY KEY,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    finalized_at TIMESTAMP
+);
+
+CREATE TABLE crawl_jobs (
+    id BIGSERIAL PRIMARY KEY,
+    run_id VARCHAR(64) NOT NULL REFERENCES crawl_runs(run_id) ON DELETE CASCADE,
+    job_type VARCHAR(20) NOT NULL,
+    target TEXT NOT NULL,
+    page_number INTEGER,
+    status VARCHAR(20) NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 3,
+    worker_id VARCHAR(200),
+    lease_until TIMESTAMP,
+    heartbeat_at TIMESTAMP,
+    available_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    last_error TEXT,
+    result JSONB,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    finished_at TIMESTAMP
+);
+
 -- Índices para mejorar rendimiento
 CREATE INDEX idx_scraped_data_hash ON scraped_data(data_hash);
 CREATE INDEX idx_scraped_data_active ON scraped_data(is_active);
 CREATE INDEX idx_files_hash ON scraped_files(file_hash);
 CREATE INDEX idx_events_date ON scraping_events(event_date DESC);
+CREATE INDEX idx_scraped_data_archive_key ON scraped_data_archive(product_key);
+CREATE INDEX idx_price_history_key_date ON price_history(product_key, observed_at DESC);
+
+-- Reclamo de trabajos: solo los pendientes o en curso (lease vencido)
+CREATE INDEX idx_crawl_jobs_claim ON crawl_jobs(job_type, available_at, id) WHERE status IN ('pending', 'running');
+CREATE INDEX idx_crawl_jobs_run ON crawl_jobs(run_id, status);
+
+-- Paginación de /api/products (OFFSET y cursor sobre scraped_date, id)
+CREATE INDEX idx_scraped_data_active_date ON scraped_data(scraped_date DESC, id DESC) WHERE is_active = TRUE;
+CREATE INDEX idx_scraped_data_category_date ON scraped_data(category, scraped_date DESC, id DESC) WHERE is_active = TRUE;
+
+-- Búsqueda de /api/products/search: índice de expresión (la misma que usa
+-- db_manager.SEARCH_VECTOR) para no agregar la columna a cada SELECT *
+CREATE INDEX idx_scraped_data_search ON scraped_data USING GIN ((
+    setweight(to_tsvector('spanish', coalesce(title, '')), 'A') ||
+    setweight(to_tsvector('spanish', coalesce(description, '')), 'B')
+)) WHERE is_active = TRUE;
+CREATE INDEX idx_scraped_data_title_trgm ON scraped_data USING GIN (title gin_trgm_ops) WHERE is_active = TRUE;
+
+-- Recalcular price_min/price_max de una categoría sin recorrerla
+CREATE INDEX idx_scraped_data_category_price ON scraped_data(category, price) WHERE is_active = TRUE;
+
+-- Mantenimiento incremental de category_stats: cada sentencia sobre
+-- scraped_data suma a su categoría las filas nuevas y resta las anteriores
+-- (tablas de transición), sin recorrer la tabla. price_min/price_max solo se
+-- recalculan cuando deja de estar activa, o cambia de precio, la fila que
+-- los fijaba. Las tablas de transición se leen con EXECUTE: cada trigger
+-- tiene solo las suyas
+CREATE OR REPLACE FUNCTION category_stats_apply() RETURNS trigger AS $fn$
+DECLARE
+    added TEXT := 'SELECT category, is_active, price, last_modified, 1 AS sign FROM new_rows';
+    removed TEXT := 'SELECT category, is_active, price, last_modified, -1 AS sign FROM old_rows';
+    delta TEXT;
+BEGIN
+    delta := CASE TG_OP
+        WHEN 'INSERT' THEN added
+        WHEN 'DELETE' THEN removed
+        ELSE added || ' UNION ALL ' || removed
+    END;
+
+    -- Orden fijo por categoría: dos escritores no se bloquean en cruz
+    EXECUTE format($q$
+        INSERT INTO category_stats AS s
+        (category, active_products, inactive_products, price_count, price_sum,
+         price_min, price_max, last_modified, refreshed_at)
+        SELECT
+            category,
+            COALESCE(SUM(sign) FILTER (WHERE is_active), 0),
+            COALESCE(SUM(sign) FILTER (WHERE NOT is_active), 0),
+            COALESCE(SUM(sign) FILTER (WHERE is_active AND price IS NOT NULL), 0),
+            COALESCE(SUM(sign * price) FILTER (WHERE is_active), 0),
+            MIN(price) FILTER (WHERE is_active AND sign > 0),
+            MAX(price) FILTER (WHERE is_active AND sign > 0),
+            MAX(last_modified) FILTER (WHERE sign > 0),
+            CURRENT_TIMESTAMP
+        FROM (%s) d
+        WHERE category IS NOT NULL
+        GROUP BY category
+        ORDER BY category
+        ON CONFLICT (category) DO UPDATE SET
+            active_products = s.active_products + EXCLUDED.active_products,
+            inactive_products = s.inactive_products + EXCLUDED.inactive_products,
+            price_count = s.price_count + EXCLUDED.price_count,
+            price_sum = s.price_sum + EXCLUDED.price_sum,
+            price_min = LEAST(s.price_min, EXCLUDED.price_min),
+            price_max = GREATEST(s.price_max, EXCLUDED.price_max),
+            last_modified = GREATEST(s.last_modified, EXCLUDED.last_modified),
+            refreshed_at = EXCLUDED.refreshed_at
+    $q$, delta);
+
+    IF TG_OP <> 'INSERT' THEN
+        EXECUTE $q$
+            UPDATE category_stats s SET
+                price_min = (SELECT MIN(price) FROM scraped_data d WHERE d.category = s.category AND d.is_active),
+                price_max = (SELECT MAX(price) FROM scraped_data d WHERE d.category = s.category AND d.is_active)
+            WHERE EXISTS (
+                SELECT 1 FROM old_rows o
+                WHERE o.category = s.category AND o.is_active
+                  AND (o.price <= s.price_min OR o.price >= s.price_max)
+            )
+        $q$;
+
+        -- Categorías que ya no tienen filas (p. ej. todo archivado)
+        DELETE FROM category_stats WHERE active_products = 0 AND inactive_products = 0;
+    END IF;
+
+    RETURN NULL;
+END;
+$fn$ LANGUAGE plpgsql;
+
+-- Una tabla de transición por evento: un trigger por cada uno
+CREATE TRIGGER scraped_data_stats_insert AFTER INSERT ON scraped_data
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION category_stats_apply();
+CREATE TRIGGER scraped_data_stats_update AFTER UPDATE ON scraped_data
+    REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION category_stats_apply();
+CREATE TRIGGER scraped_data_stats_delete AFTER DELETE ON scraped_data
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION category_stats_apply();
 
--- Vista para estadísticas rápidas
+-- Vista para estadísticas rápidas (lee el resumen, no recorre scraped_data)
 CREATE VIEW scraping_stats AS
 SELECT 
-    COUNT(*) FILTER (WHERE is_active = TRUE) as active_products,
-    COUNT(*) FILTER (WHERE is_active = FALSE) as inactive_products,
+    COALESCE(SUM(active_products), 0) as active_products,
+    COALESCE(SUM(inactive_products), 0) as inactive_products,
     MAX(last_modified) as last_scraping,
-    COUNT(DISTINCT category) as categories_count
-FROM scraped_data;
\ No newline at end of file
+    COUNT(*) FILTER (WHERE active_products > 0) as categories_count
+FROM category_stats;
\ No newline at end of file
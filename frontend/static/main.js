@@ -96,7 +96,7 @@ function updateStatsUI(stats) {
     document.getElementById('stat-products').textContent = stats.products.active || 0;
     document.getElementById('stat-files').textContent = stats.files.total || 0;
     document.getElementById('stat-categories').textContent = stats.products.categories || 0;
-    document.getElementById('stat-events').textContent = stats.events_24h.total || 0;
+    document.getElementById('stat-events').textContent = stats.events_today.total || 0;
 }
 
 // Cargar categorías
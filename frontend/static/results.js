@@ -8,7 +8,10 @@ async function loadProducts(page = 1, category = '', search = '') {
     try {
         showLoading('products-table-body');
         
-        let url = `${API_BASE_URL}/api/products?page=${page}&limit=${ITEMS_PER_PAGE}`;
+        // Con texto de búsqueda se usa el endpoint indexado del servidor
+        let url = search
+            ? `${API_BASE_URL}/api/products/search?q=${encodeURIComponent(search)}&page=${page}&limit=${ITEMS_PER_PAGE}`
+            : `${API_BASE_URL}/api/products?page=${page}&limit=${ITEMS_PER_PAGE}`;
         if (category) url += `&category=${encodeURIComponent(category)}`;
         
         const response = await fetch(url);
@@ -16,9 +19,12 @@ async function loadProducts(page = 1, category = '', search = '') {
         
         if (data.success) {
             currentPage = page;
-            totalProducts = data.total;
-            displayProducts(data.data, search);
-            updatePagination(data.total);
+            // La búsqueda no cuenta el total: alcanza con saber si hay otra página
+            totalProducts = search
+                ? (page - 1) * ITEMS_PER_PAGE + data.data.length + (data.has_more ? 1 : 0)
+                : data.total;
+            displayProducts(data.data);
+            updatePagination(totalProducts);
         } else {
             showAlert('Error cargando productos', 'danger');
         }
@@ -29,7 +35,7 @@ async function loadProducts(page = 1, category = '', search = '') {
 }
 
 // Mostrar productos en la tabla
-function displayProducts(products, searchTerm = '') {
+function displayProducts(products) {
     const tbody = document.getElementById('products-table-body');
     
     if (products.length === 0) {
@@ -37,15 +43,7 @@ function displayProducts(products, searchTerm = '') {
         return;
     }
     
-    // Filtrar por búsqueda local si existe
-    let filteredProducts = products;
-    if (searchTerm) {
-        filteredProducts = products.filter(p => 
-            p.title.toLowerCase().includes(searchTerm.toLowerCase())
-        );
-    }
-    
-    tbody.innerHTML = filteredProducts.map(product => `
+    tbody.innerHTML = products.map(product => `
         <tr>
             <td>${product.id}</td>
             <td>
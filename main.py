@@ -1,12 +1,21 @@
 import time
 from datetime import datetime
-from scraper.scraper_dynamic import DynamicScraper
+from scraper.scraper_dynamic import DynamicScraper, completed_terms
+from scraper.browser_engine import BrowserEngine, NetworkProfile
 from scraper.scraper_static import StaticScraper
 from database.db_manager import DatabaseManager
+from database.change_detector import ChangeDetector
+from database.job_queue import JobQueue, LeaseSet
 from utils.logger import setup_logger
 from utils.json_generator import JSONGenerator
+from utils.delta_exporter import DeltaExporter
+from utils.pipeline import Pipeline
+from utils.serialization import dumps
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 import os
+import socket
+import threading
 
 load_dotenv()
 logger = setup_logger('main')
@@ -15,10 +24,62 @@ class ScraperManager:
     def __init__(self):
         self.db = DatabaseManager()
         self.json_gen = JSONGenerator()
-        self.dynamic_scraper = DynamicScraper(headless=True)
-        self.static_scraper = StaticScraper()
+        self.delta_exporter = DeltaExporter(
+            self.db,
+            compact_every=int(os.getenv('JSON_DELTA_COMPACT_EVERY', 24)),
+            lag_seconds=int(os.getenv('JSON_DELTA_LAG_SECONDS', 300))
+        )
+        concurrency = int(os.getenv('SCRAPE_CONCURRENCY', 4))
+        self.dynamic_scraper = DynamicScraper(
+            headless=True,
+            concurrency=concurrency,
+            engine=BrowserEngine(
+                headless=True,
+                max_contexts=concurrency,
+                max_pages_per_context=int(os.getenv('BROWSER_MAX_PAGES_PER_CONTEXT', 50)),
+                max_heap_mb=int(os.getenv('BROWSER_MAX_HEAP_MB', 512)),
+                network_profile=NetworkProfile.from_env()
+            )
+        )
+        self.static_scraper = StaticScraper(
+            max_workers=int(os.getenv('STATIC_DOWNLOAD_WORKERS', 4)),
+            parser=os.getenv('STATIC_PARSER', 'lxml')
+        )
+        self.max_missed_runs = int(os.getenv('RECONCILE_MAX_MISSED_RUNS', 3))
+        # Páginas en espera entre etapas y productos por escritura en lote
+        self.pipeline_queue_size = int(os.getenv('PIPELINE_QUEUE_SIZE', 16))
+        self.write_batch_size = int(os.getenv('PIPELINE_WRITE_BATCH', 200))
+        self.archive_after_days = int(os.getenv('ARCHIVE_INACTIVE_DAYS', 30))
+        # Modo distribuido: los trabajos salen de crawl_jobs (ver run_worker)
+        self.job_queue = JobQueue(
+            self.db,
+            lease_seconds=int(os.getenv('CRAWL_LEASE_SECONDS', 120)),
+            max_attempts=int(os.getenv('CRAWL_MAX_ATTEMPTS', 3)),
+            retry_delay=int(os.getenv('CRAWL_RETRY_DELAY', 30))
+        )
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}"
+        # Con varios objetivos en paralelo (scheduler) solo exporta uno a la vez
+        self._export_lock = threading.Lock()
+        
+    def search_terms(self):
+        """SEARCH_TERMS admite varios términos separados por coma"""
+        return [
+            term.strip()
+            for term in os.getenv('SEARCH_TERMS', os.getenv('SEARCH_TERM', 'laptop')).split(',')
+            if term.strip()
+        ]
+    
+    def static_urls(self):
+        """STATIC_URL admite varias URLs separadas por coma"""
+        return [
+            url.strip()
+            for url in os.getenv('STATIC_URL', 'https://file-examples.com/index.php/sample-documents-download/').split(',')
+            if url.strip()
+        ]
         
-    def run_scraping(self):
+    def run_scraping(self, search_terms=None, static_urls=None):
+        """Ejecución completa; retorna sus estadísticas o None si falló"""
+        # search_terms/static_urls acotan los objetivos (por defecto, los del .env)
         logger.info("="*60)
         logger.info("INICIANDO PROCESO DE SCRAPING")
         logger.info("="*60)
@@ -26,54 +87,72 @@ class ScraperManager:
         start_time = time.time()
         total_new = 0
         total_updated = 0
+        total_deactivated = 0
         
         try:
-            # Scraping dinámico
+            # Scraping dinámico: fetch → extract → dedupe → write en paralelo
             logger.info("Ejecutando scraping dinámico...")
-            search_term = os.getenv('SEARCH_TERM', 'laptop')
-
-            # 🔥 FIX: eliminar max_pages
-            products = self.dynamic_scraper.scrape_mercadolibre(
-                search_term=search_term
-            )
-            
-            logger.info(f"Productos obtenidos: {len(products)}")
+            if search_terms is None:
+                search_terms = self.search_terms()
+            if static_urls is None:
+                static_urls = self.static_urls()
+            pages = self.dynamic_scraper.listing_pages(search_terms, int(os.getenv('MAX_PAGES', 1)))
+            # (término, página) -> tarjetas o excepción, para saber qué términos reconciliar
+            outcome = {}
             
-            # Guardar en base de datos
-            for product in products:
-                try:
-                    result = self.db.insert_scraped_data(product)
-                    if result:
-                        total_new += 1
-                except Exception as e:
-                    logger.warning(f"Error insertando producto: {e}")
-                    total_updated += 1
-            
-            logger.info(f"Nuevos: {total_new}, Actualizados: {total_updated}")
-            
-            # Scraping estático
-            logger.info("Ejecutando scraping estático...")
-            static_url = os.getenv('STATIC_URL', 'https://file-examples.com/index.php/sample-documents-download/')
-            
-            files = self.static_scraper.scrape_static_page(static_url)
-            
-            for file in files:
-                try:
-                    self.db.insert_file(file)
-                except Exception as e:
-                    logger.warning(f"Error insertando archivo: {e}")
+            def fetch(emit):
+                outcome.update(self.dynamic_scraper.crawl_pages(pages, sink=emit, stop_on_empty=True))
+
+            # El scraping estático corre en paralelo con el pipeline de productos
+            with ThreadPoolExecutor(max_workers=1, thread_name_prefix='static') as executor:
+                static_future = executor.submit(self.run_static_targets, static_urls)
+                
+                if search_terms:
+                    result = self.scrape_products(fetch)
+                else:
+                    result = {'inserted': 0, 'updated': 0, 'unchanged': 0, 'price_changes': 0, 'seen': {}}
+                total_new = result['inserted']
+                total_updated = result['updated']
+                
+                logger.info(f"Productos obtenidos: {len(result['seen'])}")
+                logger.info(f"Cambios de precio registrados: {result['price_changes']}")
+                logger.info(f"Nuevos: {total_new}, Actualizados: {total_updated}, Sin cambios: {result['unchanged']}")
+                
+                # Un término con alguna página fallida no se reconcilia: sus
+                # productos no vistos pueden estar en esa página. Tampoco uno
+                # cuya página 1 vino vacía
+                terms = completed_terms(outcome)
+                skipped = set(search_terms) - terms
+                if skipped:
+                    logger.warning(f"Sin reconciliar (páginas fallidas o sin resultados): {', '.join(sorted(skipped))}")
+                total_deactivated = self.reconcile(
+                    categories=terms,
+                    seen_keys=result['seen'].keys()
+                )
+                
+                files = static_future.result()
             
-            logger.info(f"Archivos descargados: {len(files)}")
+            # Resultado observable de la ejecución (lo usa el scheduler adaptativo)
+            stats = {
+                'products': len(result['seen']),
+                'new': total_new,
+                'updated': total_updated,
+                'deactivated': total_deactivated,
+                'files': len(files),
+                'files_changed': sum(1 for file in files if not file.get('not_modified'))
+            }
             
-            # Generar JSONs
-            logger.info("Generando archivos JSON...")
-            self.json_gen.generate_all_json()
+            # Sin cambios los JSON publicados siguen vigentes
+            if total_new or total_updated or total_deactivated or stats['files_changed']:
+                self.export_json()
+            else:
+                logger.info("Sin cambios: no se regeneran los JSON")
             
             execution_time = round(time.time() - start_time, 2)
             self.db.log_event(
                 event_type='scraping_completed',
-                description=f'Scraping completado exitosamente. Nuevos: {total_new}, Actualizados: {total_updated}',
-                affected_records=total_new + total_updated,
+                description=f'Scraping completado exitosamente. Nuevos: {total_new}, Actualizados: {total_updated}, Desactivados: {total_deactivated}',
+                affected_records=total_new + total_updated + total_deactivated,
                 execution_time=execution_time,
                 status='success'
             )
@@ -81,7 +160,7 @@ class ScraperManager:
             logger.info(f"Proceso completado en {execution_time}s")
             logger.info("="*60)
             
-            return True
+            return stats
             
         except Exception as e:
             logger.error(f"Error en proceso de scraping: {e}")
@@ -95,8 +174,343 @@ class ScraperManager:
                 error_message=str(e)
             )
             
+            return None
+    
+    def reconcile(self, categories, seen_keys):
+        """Desactiva lo que dejó de aparecer en sus categorías"""
+        # category_stats lo mantienen los triggers de scraped_data
+        reconciled = self.db.reconcile_products(
+            categories=categories,
+            seen_keys=seen_keys,
+            max_missed_runs=self.max_missed_runs
+        )
+        logger.info(f"Desactivados: {reconciled['deactivated']}")
+        
+        return reconciled['deactivated']
+    
+    def export_json(self):
+        """Genera los JSON: full (completos), delta (incrementales) o both"""
+        export_mode = os.getenv('JSON_EXPORT_MODE', 'full')
+        with self._export_lock:
+            if export_mode in ('full', 'both'):
+                logger.info("Generando archivos JSON...")
+                self.json_gen.generate_all_json()
+            if export_mode in ('delta', 'both'):
+                logger.info("Generando exportación incremental...")
+                self.delta_exporter.export_all()
+    
+    def scrape_products(self, fetch, on_written=None):
+        """Pipeline con colas acotadas: las páginas se guardan mientras se cargan las siguientes"""
+        # fetch(emit) produce páginas (término, página, tarjetas[, trabajo]);
+        # on_written(page, items) recibe los productos de cada página una vez
+        # que están escritos en la BD
+        # El índice se carga recién con la primera página (classify lo hace
+        # si hace falta): un worker sin trabajos no recorre scraped_data
+        detector = ChangeDetector(self.db)
+        
+        # product_key -> categoría de todo lo visto (para la reconciliación)
+        seen = {}
+        counts = {'inserted': 0, 'updated': 0, 'unchanged': 0, 'price_changes': 0}
+        batch = []
+        # Páginas cuyos productos ya están en `batch` o en un lote anterior
+        written_pages = []
+        
+        # Cada página viaja como (page, items) y su marca sigue a sus productos
+        # hasta la escritura. Con un worker por etapa el orden se mantiene: al
+        # llegar la marca, todos sus productos ya están en el lote
+        def extract(page, emit):
+            term, page_number, cards = page[:3]
+            items = self.dynamic_scraper.build_items(cards, term, page_number)
+            if items or on_written is not None:
+                emit((page, items))
+        
+        def dedupe(page_items, emit):
+            page, items = page_items
+            # Un producto repetido en otra página o término se procesa una sola vez
+            fresh = [item for item in items if item['product_key'] not in seen]
+            for item in fresh:
+                seen[item['product_key']] = item['category']
+            
+            changes = detector.classify(fresh)
+            counts['unchanged'] += len(changes['unchanged'])
+            for item in changes['new'] + changes['changed']:
+                emit(item)
+            if on_written is not None:
+                emit(page_items)
+        
+        def write(item, emit):
+            if isinstance(item, tuple):
+                written_pages.append(item)
+                # Sin productos pendientes la página ya está escrita
+                if not batch:
+                    flush(emit)
+                return
+            batch.append(item)
+            if len(batch) >= self.write_batch_size:
+                flush(emit)
+        
+        def flush(emit):
+            if batch:
+                write_batch()
+            for page, items in written_pages:
+                on_written(page, items)
+            written_pages.clear()
+        
+        def write_batch():
+            result = self.db.insert_scraped_data_batch(batch)
+            counts['inserted'] += result['inserted']
+            counts['updated'] += result['updated']
+            # Los descartados no quedan en el índice: se reintentan la próxima vez
+            failed = set(result['failed'])
+            written = [item for item in batch if item['product_key'] not in failed]
+            # Historial de precios (solo los que cambiaron)
+            counts['price_changes'] += self.db.insert_price_history_batch(written)
+            detector.apply(written)
+            batch.clear()
+        
+        pipeline = (
+            Pipeline('products')
+            .source('fetch', fetch)
+            .stage('extract', extract, queue_size=self.pipeline_queue_size)
+            .stage('dedupe', dedupe, queue_size=self.pipeline_queue_size)
+            .stage('write', write, queue_size=self.write_batch_size * 2, flush=flush)
+        )
+        
+        try:
+            pipeline.run()
+        finally:
+            # Throughput y profundidad de cola por etapa, también si falló.
+            # Sin páginas procesadas no se registra nada
+            stats = pipeline.stats()
+            if stats['stages']['extract']['items_in'] or pipeline.error is not None:
+                self._log_pipeline_stats(stats, counts, pipeline.error)
+        
+        counts['seen'] = seen
+        return counts
+    
+    def _log_pipeline_stats(self, stats, counts, error):
+        """Registra el throughput del pipeline como evento pipeline_stats"""
+        logger.info(f"Pipeline: {stats}")
+        try:
+            self.db.log_event(
+                event_type='pipeline_stats',
+                description=dumps(stats).decode('utf-8'),
+                affected_records=counts['inserted'] + counts['updated'],
+                execution_time=stats['elapsed_s'],
+                status='success' if error is None else 'error'
+            )
+        except Exception as e:
+            logger.warning(f"Error registrando estadísticas del pipeline: {e}")
+    
+    def run_static_scraping(self, static_url):
+        """Scraping estático y registro de los archivos descargados"""
+        logger.info("Ejecutando scraping estático...")
+        files = self.static_scraper.scrape_static_page(static_url)
+        
+        for file in files:
+            try:
+                self.db.insert_file(file)
+            except Exception as e:
+                logger.warning(f"Error insertando archivo: {e}")
+        
+        unchanged = sum(1 for file in files if file.get('not_modified'))
+        logger.info(f"Archivos descargados: {len(files) - unchanged}, sin cambios (304): {unchanged}")
+        return files
+    
+    def run_static_targets(self, static_urls):
+        """Scraping estático de varias URLs, una tras otra"""
+        files = []
+        for static_url in static_urls:
+            files.extend(self.run_static_scraping(static_url))
+        return files
+    
+    def enqueue_run(self, search_terms=None, static_urls=None):
+        """Encola una ejecución en crawl_jobs para los workers (por defecto, los objetivos del .env)"""
+        run_id = self.job_queue.enqueue_run(
+            search_terms=self.search_terms() if search_terms is None else search_terms,
+            max_pages=int(os.getenv('MAX_PAGES', 1)),
+            static_urls=self.static_urls() if static_urls is None else static_urls
+        )
+        return run_id
+    
+    def claim_listing_jobs(self):
+        """Reclama tantas páginas de listado como contextos tiene el crawler"""
+        return self.job_queue.claim(self.worker_id, 'listing', limit=self.dynamic_scraper.concurrency)
+    
+    def fetch_listing_jobs(self, emit, leases, jobs=None):
+        """Fuente del pipeline en modo worker: reclama páginas de listado hasta vaciar la cola"""
+        # jobs: primer lote ya reclamado por run_worker
+        while True:
+            jobs = jobs or self.claim_listing_jobs()
+            if not jobs:
+                return
+            
+            # El lease se sigue renovando hasta que los productos estén escritos
+            leases.add(jobs)
+            by_page = {(job['target'], job['page_number']): job for job in jobs}
+            
+            def sink(page):
+                # El trabajo viaja con la página y se completa después de escribirla
+                emit(page + (by_page[page[:2]],))
+            
+            outcome = self.dynamic_scraper.crawl_pages(by_page.keys(), sink)
+            
+            for key, job in by_page.items():
+                result = outcome.get(key)
+                if isinstance(result, Exception):
+                    self.job_queue.fail(job, result)
+                    leases.discard(job)
+                elif result == 0:
+                    # Página vacía: se completa y se saltean las siguientes del término
+                    self.job_queue.complete(job, {'keys': [], 'cards': 0})
+                    self.job_queue.skip_after(job)
+                    leases.discard(job)
+            jobs = None
+    
+    def complete_listing_job(self, leases, page, items):
+        """Guarda en el trabajo los productos vistos (para la reconciliación de la ejecución)"""
+        if len(page) > 3:
+            self.job_queue.complete(page[3], {
+                'keys': [item['product_key'] for item in items],
+                'cards': len(page[2])
+            })
+            leases.discard(page[3])
+    
+    def process_static_jobs(self):
+        """Reclama y procesa las URLs estáticas de la cola"""
+        files = []
+        while True:
+            jobs = self.job_queue.claim(self.worker_id, 'static', limit=1)
+            if not jobs:
+                return files
+            
+            job = jobs[0]
+            try:
+                with self.job_queue.leased(jobs, self.worker_id):
+                    downloaded = self.run_static_scraping(job['target'])
+                self.job_queue.complete(job, {
+                    'files': len(downloaded),
+                    'changed': sum(1 for file in downloaded if not file.get('not_modified'))
+                })
+                files.extend(downloaded)
+            except Exception as e:
+                logger.error(f"Error en trabajo estático {job['target']}: {e}")
+                self.job_queue.fail(job, e)
+    
+    def run_worker(self):
+        """Procesa trabajos de crawl_jobs hasta vaciar la cola (modo distribuido)"""
+        logger.info(f"Worker {self.worker_id}: procesando la cola de trabajos")
+        start_time = time.time()
+        
+        try:
+            # Se reclama antes de armar el pipeline: sin páginas pendientes no
+            # se carga el índice de cambios ni se registran estadísticas
+            jobs = self.claim_listing_jobs()
+            with ThreadPoolExecutor(max_workers=1, thread_name_prefix='static') as executor:
+                static_future = executor.submit(self.process_static_jobs)
+                
+                if jobs:
+                    # Si el pipeline falla, los trabajos sin escribir dejan de
+                    # renovarse y vuelven a la cola al vencer su lease
+                    leases = LeaseSet()
+                    leases.add(jobs)
+                    with self.job_queue.leased(leases, self.worker_id):
+                        result = self.scrape_products(
+                            lambda emit: self.fetch_listing_jobs(emit, leases, jobs),
+                            on_written=lambda page, items: self.complete_listing_job(leases, page, items)
+                        )
+                else:
+                    result = None
+                files = static_future.result()
+            
+            if result is None and not files:
+                # Cola vacía: nada que registrar; solo se cierran ejecuciones terminadas
+                self.finalize_runs()
+                return True
+            
+            if result is None:
+                result = {'inserted': 0, 'updated': 0, 'seen': {}}
+            logger.info(
+                f"Worker {self.worker_id}: productos {len(result['seen'])}, "
+                f"nuevos {result['inserted']}, actualizados {result['updated']}, archivos {len(files)}"
+            )
+            
+            # Si este worker terminó la última página de una ejecución, la cierra
+            self.finalize_runs()
+            return True
+            
+        except Exception as e:
+            logger.error(f"Error en worker {self.worker_id}: {e}")
+            
+            self.db.log_event(
+                event_type='worker_error',
+                description=f'Error en worker {self.worker_id}',
+                execution_time=round(time.time() - start_time, 2),
+                status='error',
+                error_message=str(e)
+            )
+            return False
+    
+    def finalize_runs(self):
+        """Reconcilia y exporta las ejecuciones distribuidas que ya no tienen trabajos pendientes"""
+        run_ids = self.job_queue.claim_finished_runs()
+        for run_id in run_ids:
+            start_time = time.time()
+            seen_keys, terms = self.job_queue.run_results(run_id)
+            
+            deactivated = self.reconcile(categories=terms, seen_keys=seen_keys)
+            
+            summary = self.job_queue.run_summary(run_id)
+            self.db.log_event(
+                event_type='crawl_run_completed',
+                description=f'Ejecución {run_id} finalizada. Trabajos: {summary}, Productos vistos: {len(seen_keys)}, Desactivados: {deactivated}',
+                affected_records=len(seen_keys) + deactivated,
+                execution_time=round(time.time() - start_time, 2),
+                status='error' if summary.get('failed') else 'success'
+            )
+            logger.info(f"Ejecución {run_id} finalizada: {summary}")
+        
+        # Una sola exportación para todas las ejecuciones cerradas en esta vuelta
+        if run_ids:
+            self.export_json()
+    
+    def archive_inactive(self):
+        """Mueve a la tabla fría los productos inactivos antiguos"""
+        start_time = time.time()
+        
+        try:
+            archived = self.db.archive_inactive(older_than_days=self.archive_after_days)
+            self.job_queue.purge_runs()
+            # Refresco completo del resumen: corrige cualquier desvío acumulado
+            self.db.refresh_category_stats()
+            execution_time = round(time.time() - start_time, 2)
+            logger.info(f"Productos archivados: {archived}")
+            
+            self.db.log_event(
+                event_type='archive_completed',
+                description=f'Productos inactivos archivados: {archived}',
+                affected_records=archived,
+                execution_time=execution_time,
+                status='success'
+            )
+            return True
+            
+        except Exception as e:
+            logger.error(f"Error archivando productos: {e}")
+            
+            self.db.log_event(
+                event_type='archive_error',
+                description='Error archivando productos inactivos',
+                execution_time=round(time.time() - start_time, 2),
+                status='error',
+                error_message=str(e)
+            )
             return False
     
+    def close(self):
+        """Libera el navegador persistente"""
+        self.dynamic_scraper.close()
+
     def setup_database(self):
         logger.info("Configurando base de datos...")
         
@@ -104,11 +518,9 @@ class ScraperManager:
             with open('database_schema.sql', 'r', encoding='utf-8') as f:
                 schema = f.read()
             
-            conn = self.db.get_connection()
-            cursor = conn.cursor()
-            cursor.execute(schema)
-            conn.commit()
-            conn.close()
+            with self.db.connection() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute(schema)
             
             logger.info("Base de datos configurada correctamente")
             return True
@@ -126,7 +538,21 @@ def main():
         logger.info("Modo setup: Inicializando base de datos...")
         manager.setup_database()
     
-    success = manager.run_scraping()
+    # CRAWL_QUEUE=true: este proceso es un worker de crawl_jobs (se puede
+    # escalar a N réplicas); CRAWL_WORKER_POLL > 0 lo mantiene esperando trabajos
+    use_queue = os.getenv('CRAWL_QUEUE', 'false').lower() == 'true'
+    poll_interval = int(os.getenv('CRAWL_WORKER_POLL', 0))
+    
+    try:
+        if not use_queue:
+            success = manager.run_scraping()
+        else:
+            success = manager.run_worker()
+            while poll_interval > 0:
+                time.sleep(poll_interval)
+                success = manager.run_worker()
+    finally:
+        manager.close()
     
     if success:
         logger.info("✓ Proceso finalizado exitosamente")
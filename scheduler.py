@@ -1,6 +1,7 @@
 from apscheduler.schedulers.blocking import BlockingScheduler
+from apscheduler.executors.pool import ThreadPoolExecutor
 from apscheduler.triggers.interval import IntervalTrigger
-from datetime import datetime
+from datetime import datetime, timedelta
 from main import ScraperManager
 from utils.logger import setup_logger
 from dotenv import load_dotenv
@@ -9,49 +10,184 @@ import os
 load_dotenv()
 logger = setup_logger('scheduler')
 
-def scheduled_job():
-    """Tarea programada que ejecuta el scraping"""
-    logger.info(f"Tarea programada ejecutándose: {datetime.now()}")
-    
-    manager = ScraperManager()
-    success = manager.run_scraping()
-    
+# Se reutiliza entre ejecuciones para mantener Chromium y el pool de BD en caliente
+_manager = None
+_scheduler = None
+# job_id -> AdaptiveInterval de cada objetivo
+_schedules = {}
+
+def get_manager():
+    """Retorna el ScraperManager compartido por todas las ejecuciones"""
+    global _manager
+    if _manager is None:
+        _manager = ScraperManager()
+    return _manager
+
+class AdaptiveInterval:
+    """Intervalo de un objetivo que se ajusta según su tasa de cambio observada"""
+
+    # Si cambia mucho se consulta el doble de seguido; si no cambia nada se
+    # espacia 1.5x. Siempre dentro de [minimum, maximum] minutos.
+
+    def __init__(self, minutes, minimum, maximum, high_rate=0.2, low_rate=0.01):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.minutes = min(max(minutes, minimum), maximum)
+        self.high_rate = high_rate
+        self.low_rate = low_rate
+        self.last_checked = None
+        self.last_rate = None
+
+    def update(self, change_rate):
+        """Retorna el nuevo intervalo en minutos"""
+        self.last_rate = change_rate
+        if change_rate is None:
+            return self.minutes
+        if change_rate >= self.high_rate:
+            self.minutes = max(self.minimum, self.minutes / 2)
+        elif change_rate <= self.low_rate:
+            self.minutes = min(self.maximum, self.minutes * 1.5)
+        return self.minutes
+
+def use_queue():
+    return os.getenv('CRAWL_QUEUE', 'false').lower() == 'true'
+
+def observe_change_rate(manager, kind, target, since, stats=None):
+    """Tasa de cambio del objetivo desde `since` (None si no se puede medir)"""
+    # stats: resultado de run_scraping en modo local; en modo cola se lee lo
+    # que registraron los workers
+    if since is None:
+        return None
+    if kind == 'listing':
+        # Productos cuya huella cambió: vale también para los workers de la cola
+        return manager.db.get_change_rate(target, since)
+    if stats is not None:
+        files, changed = stats['files'], stats['files_changed']
+    else:
+        results = manager.job_queue.static_results(target, since)
+        files, changed = results['files'], results['changed']
+    if not files:
+        return None
+    return changed / files
+
+def target_job(job_id, kind, target):
+    """Tarea programada de un objetivo: un término de búsqueda o una URL estática"""
+    logger.info(f"Tarea {job_id} ejecutándose: {datetime.now()}")
+
+    manager = get_manager()
+    schedule = _schedules[job_id]
+    search_terms = [target] if kind == 'listing' else []
+    static_urls = [target] if kind == 'static' else []
+
+    # Las marcas que se comparan (last_modified, finished_at) las pone la BD:
+    # el inicio se toma de su reloj, no del de este proceso
+    try:
+        started = manager.db.now()
+    except Exception as e:
+        logger.warning(f"No se pudo leer la hora de la BD: {e}")
+        started = None
+    if use_queue():
+        # Con CRAWL_QUEUE=true el scheduler solo encola: los workers (main.py)
+        # scrapean. La tasa se mide sobre lo que hicieron desde la vuelta anterior
+        since = schedule.last_checked
+        stats = None
+        try:
+            manager.enqueue_run(search_terms=search_terms, static_urls=static_urls)
+            # Cierra ejecuciones anteriores cuyos workers terminaron o murieron
+            manager.finalize_runs()
+            success = True
+        except Exception as e:
+            logger.error(f"Error encolando trabajos de {job_id}: {e}")
+            success = False
+    else:
+        since = started
+        stats = manager.run_scraping(search_terms=search_terms, static_urls=static_urls)
+        success = stats is not None
+    schedule.last_checked = started
+
     if success:
-        logger.info("Tarea completada exitosamente")
+        logger.info(f"Tarea {job_id} completada exitosamente")
     else:
-        logger.error("Tarea completada con errores")
+        logger.error(f"Tarea {job_id} completada con errores")
+
+    try:
+        change_rate = observe_change_rate(manager, kind, target, since, stats) if success else None
+    except Exception as e:
+        logger.warning(f"No se pudo medir la tasa de cambio de {job_id}: {e}")
+        change_rate = None
+
+    previous = schedule.minutes
+    minutes = schedule.update(change_rate)
+    if minutes != previous:
+        logger.info(f"{job_id}: tasa de cambio {change_rate:.3f}, intervalo {previous:.0f} -> {minutes:.0f} min")
+        _scheduler.reschedule_job(job_id, trigger=IntervalTrigger(minutes=minutes))
+
+def archive_job():
+    """Tarea programada que archiva los productos inactivos antiguos"""
+    logger.info(f"Archivado ejecutándose: {datetime.now()}")
+    get_manager().archive_inactive()
 
 def main():
     """Inicia el scheduler"""
+    global _scheduler
     interval_minutes = int(os.getenv('SCRAPE_INTERVAL', 30))
-    
+    min_minutes = int(os.getenv('SCRAPE_MIN_INTERVAL', 10))
+    max_minutes = int(os.getenv('SCRAPE_MAX_INTERVAL', 360))
+    archive_hours = int(os.getenv('ARCHIVE_INTERVAL_HOURS', 24))
+
+    manager = get_manager()
+    targets = [('listing', term) for term in manager.search_terms()]
+    targets += [('static', url) for url in manager.static_urls()]
+
     logger.info("="*60)
     logger.info("INICIANDO SCHEDULER DE SCRAPING")
-    logger.info(f"Intervalo: cada {interval_minutes} minutos")
+    logger.info(f"Objetivos: {len(targets)}, intervalo inicial {interval_minutes} min ({min_minutes}-{max_minutes})")
     logger.info("="*60)
-    
-    scheduler = BlockingScheduler()
-    
-    # Agregar tarea programada
-    scheduler.add_job(
-        scheduled_job,
-        trigger=IntervalTrigger(minutes=interval_minutes),
-        id='scraping_job',
-        name='Web Scraping Job',
+
+    # Una ejecución por vez por objetivo: si una tarda más que el intervalo,
+    # las vueltas atrasadas se juntan en una sola (coalesce) en lugar de apilarse.
+    # Sin límite de misfire: con pocos hilos una vuelta puede esperar más que
+    # cualquier margen fijo, y descartarla dejaría al objetivo sin scrapear
+    _scheduler = BlockingScheduler(
+        executors={'default': ThreadPoolExecutor(int(os.getenv('SCHEDULER_WORKERS', 1)))},
+        job_defaults={'max_instances': 1, 'coalesce': True, 'misfire_grace_time': None}
+    )
+
+    # Cada objetivo con su propio intervalo. Las primeras vueltas se reparten
+    # a lo largo del intervalo inicial en lugar de dispararse todas juntas
+    stagger = timedelta(minutes=interval_minutes) / max(len(targets), 1)
+    first_run = datetime.now()
+    for index, (kind, target) in enumerate(targets):
+        job_id = f"{kind}:{target}"
+        _schedules[job_id] = AdaptiveInterval(interval_minutes, min_minutes, max_minutes)
+        _scheduler.add_job(
+            target_job,
+            trigger=IntervalTrigger(minutes=interval_minutes),
+            args=(job_id, kind, target),
+            id=job_id,
+            name=f'Scraping {job_id}',
+            next_run_time=first_run + index * stagger,
+            replace_existing=True
+        )
+
+    _scheduler.add_job(
+        archive_job,
+        trigger=IntervalTrigger(hours=archive_hours),
+        id='archive_job',
+        name='Archive Inactive Products',
         replace_existing=True
     )
-    
-    # Ejecutar inmediatamente al inicio
-    logger.info("Ejecutando primera tarea inmediatamente...")
-    scheduled_job()
-    
+
     # Iniciar scheduler
     try:
         logger.info("Scheduler iniciado. Presiona Ctrl+C para detener.")
-        scheduler.start()
+        _scheduler.start()
     except (KeyboardInterrupt, SystemExit):
         logger.info("Scheduler detenido por el usuario")
-        scheduler.shutdown()
+        _scheduler.shutdown()
+    finally:
+        if _manager is not None:
+            _manager.close()
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,263 @@
+from playwright.async_api import async_playwright
+from contextlib import asynccontextmanager
+import asyncio
+import os
+import random
+import threading
+from urllib.parse import urlsplit
+from utils.logger import setup_logger
+
+logger = setup_logger("browser_engine")
+
+USER_AGENTS = [
+    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
+    "(KHTML, like Gecko) Chrome/121.0.6167.85 Safari/537.36"
+]
+
+# Heap JS usado por la página (solo disponible en Chromium)
+HEAP_JS = "() => (performance.memory ? performance.memory.usedJSHeapSize : 0)"
+
+# Tipos de recurso que no aportan datos al scraping
+BLOCKED_RESOURCE_TYPES = ("image", "media", "font")
+
+# Analítica, publicidad y trackers de terceros
+TRACKER_DOMAINS = (
+    "google-analytics.com",
+    "googletagmanager.com",
+    "googlesyndication.com",
+    "googleadservices.com",
+    "doubleclick.net",
+    "facebook.net",
+    "facebook.com",
+    "hotjar.com",
+    "criteo.com",
+    "criteo.net",
+    "scorecardresearch.com",
+    "adsrvr.org",
+    "bing.com",
+    "clarity.ms",
+    "tiktok.com",
+)
+
+
+class NetworkProfile:
+    """Reglas de interceptación de red aplicadas a cada contexto"""
+
+    def __init__(self, blocked_resource_types=BLOCKED_RESOURCE_TYPES, blocked_domains=TRACKER_DOMAINS):
+        self.blocked_resource_types = frozenset(blocked_resource_types)
+        self.blocked_domains = tuple(blocked_domains)
+        self.blocked = 0
+
+    @classmethod
+    def from_env(cls):
+        """Construye el perfil desde BROWSER_BLOCK_RESOURCES y BROWSER_BLOCK_TRACKERS"""
+        resource_types = os.getenv('BROWSER_BLOCK_RESOURCES', ','.join(BLOCKED_RESOURCE_TYPES))
+        block_trackers = os.getenv('BROWSER_BLOCK_TRACKERS', 'true').lower() == 'true'
+        return cls(
+            blocked_resource_types=[t.strip() for t in resource_types.split(',') if t.strip()],
+            blocked_domains=TRACKER_DOMAINS if block_trackers else ()
+        )
+
+    @property
+    def enabled(self):
+        return bool(self.blocked_resource_types or self.blocked_domains)
+
+    def should_block(self, request):
+        if request.resource_type in self.blocked_resource_types:
+            return True
+        host = urlsplit(request.url).hostname or ""
+        return any(host == d or host.endswith("." + d) for d in self.blocked_domains)
+
+    async def handle_route(self, route):
+        if self.should_block(route.request):
+            self.blocked += 1
+            await route.abort()
+        else:
+            await route.continue_()
+
+
+class _ContextSlot:
+    """Contexto de navegador reutilizable con su contador de uso"""
+
+    def __init__(self, context, browser):
+        self.context = context
+        # Navegador dueño del contexto: si se relanzó, el contexto se descarta
+        self.browser = browser
+        self.pages = 0
+        self.heap_mb = 0.0
+
+
+class BrowserEngine:
+    """Chromium persistente sobre playwright.async_api con contextos reciclables"""
+
+    def __init__(self, headless=True, max_contexts=4, max_pages_per_context=50, max_heap_mb=512,
+                 network_profile=None):
+        self.headless = headless
+        self.network_profile = network_profile
+        self.max_contexts = max(1, max_contexts)
+        self.max_pages_per_context = max_pages_per_context
+        self.max_heap_mb = max_heap_mb
+
+        self._loop = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+        self._playwright = None
+        self._browser = None
+        self._idle = []
+        # Se crean en el loop del motor; el semáforo no se reemplaza nunca para
+        # que max_contexts valga también para los contextos ya entregados
+        self._slots = None
+        self._launch_lock = None
+
+    def start(self):
+        """Inicia el event loop del motor en un hilo dedicado"""
+        with self._start_lock:
+            if self._loop is not None:
+                return
+            self._loop = asyncio.new_event_loop()
+            self._thread = threading.Thread(
+                target=self._loop.run_forever,
+                name="browser-engine",
+                daemon=True
+            )
+            self._thread.start()
+
+    def run(self, coro, timeout=None):
+        """Ejecuta una corrutina en el loop del motor y espera el resultado"""
+        self.start()
+        future = asyncio.run_coroutine_threadsafe(coro, self._loop)
+        return future.result(timeout)
+
+    def close(self):
+        """Cierra el navegador y detiene el event loop"""
+        if self._loop is None:
+            return
+        try:
+            self.run(self._shutdown(), timeout=60)
+        except Exception as e:
+            logger.warning(f"Error cerrando el navegador: {e}")
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=10)
+        self._loop.close()
+        self._loop = None
+        self._thread = None
+
+    async def _ensure_browser(self):
+        if self._browser is not None and self._browser.is_connected():
+            return self._browser
+
+        # Un solo arranque aunque varios workers pidan contexto a la vez
+        if self._launch_lock is None:
+            self._launch_lock = asyncio.Lock()
+
+        async with self._launch_lock:
+            if self._browser is not None and self._browser.is_connected():
+                return self._browser
+
+            if self._browser is not None:
+                logger.warning("El navegador se desconectó, relanzando Chromium")
+                # Los contextos libres eran del navegador anterior
+                self._idle = []
+                try:
+                    await self._browser.close()
+                except Exception:
+                    pass
+                self._browser = None
+
+            if self._playwright is None:
+                self._playwright = await async_playwright().start()
+
+            self._browser = await self._playwright.chromium.launch(
+                headless=self.headless,
+                args=["--disable-dev-shm-usage", "--no-sandbox"]
+            )
+            logger.info("🚀 Chromium iniciado")
+            return self._browser
+
+    async def _new_context(self, browser):
+        context = await browser.new_context(
+            user_agent=random.choice(USER_AGENTS),
+            locale="es-AR"
+        )
+        if self.network_profile is not None and self.network_profile.enabled:
+            await context.route("**/*", self.network_profile.handle_route)
+        return context
+
+    async def _checkout(self):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_contexts)
+
+        await self._slots.acquire()
+        try:
+            browser = await self._ensure_browser()
+            if self._idle:
+                return self._idle.pop()
+            return _ContextSlot(await self._new_context(browser), browser)
+        except Exception:
+            self._slots.release()
+            raise
+
+    async def _checkin(self, slot):
+        try:
+            if not self._needs_recycle(slot) and slot.browser is self._browser:
+                self._idle.append(slot)
+                return
+
+            logger.info(
+                f"♻ Reciclando contexto ({slot.pages} páginas, heap {slot.heap_mb:.0f} MB)"
+            )
+            try:
+                await slot.context.close()
+            except Exception:
+                pass
+        finally:
+            self._slots.release()
+
+    def _needs_recycle(self, slot):
+        """Un contexto se recicla tras N páginas o si el heap JS creció demasiado"""
+        if self.max_pages_per_context and slot.pages >= self.max_pages_per_context:
+            return True
+        if self.max_heap_mb and slot.heap_mb >= self.max_heap_mb:
+            return True
+        return False
+
+    @asynccontextmanager
+    async def page(self):
+        """Entrega una página nueva sobre un contexto del pool"""
+        slot = await self._checkout()
+        page = None
+        try:
+            page = await slot.context.new_page()
+            yield page
+        finally:
+            slot.pages += 1
+            if page is not None:
+                try:
+                    heap = await page.evaluate(HEAP_JS)
+                    slot.heap_mb = max(slot.heap_mb, heap / (1024 * 1024))
+                except Exception:
+                    pass
+                try:
+                    await page.close()
+                except Exception:
+                    pass
+            await self._checkin(slot)
+
+    async def _shutdown(self):
+        for slot in self._idle:
+            try:
+                await slot.context.close()
+            except Exception:
+                pass
+        self._idle = []
+
+        if self._browser is not None:
+            await self._browser.close()
+            self._browser = None
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
+        # Quedaban ligados a este loop; un start() posterior crea otros
+        self._slots = None
+        self._launch_lock = None
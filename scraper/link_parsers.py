@@ -0,0 +1,113 @@
+from bs4 import BeautifulSoup, SoupStrainer
+import time
+
+try:
+    from lxml import etree
+except ImportError:
+    etree = None
+
+# Atributos donde los botones/enlaces esconden la URL de descarga
+DATA_ATTRIBUTES = ("data-file", "data-url", "data-download")
+
+LINK_TAGS = ("a", "button")
+
+# Bloques con los que se alimenta el parser incremental
+FEED_SIZE = 64 * 1024
+
+
+def _element_links(tag, attrs):
+    """URLs candidatas de un elemento <a>/<button>"""
+    if tag == "a" and attrs.get("href"):
+        yield attrs["href"]
+
+    for attr in DATA_ATTRIBUTES:
+        if attrs.get(attr):
+            yield attrs[attr]
+            break
+
+
+def iter_links_lxml(html):
+    """Una sola pasada con el parser incremental de lxml, filtrando solo <a>/<button>"""
+    parser = etree.HTMLPullParser(events=("end",), tag=LINK_TAGS)
+
+    for start in range(0, len(html), FEED_SIZE):
+        parser.feed(html[start:start + FEED_SIZE])
+        for _, element in parser.read_events():
+            yield from _element_links(element.tag, element.attrib)
+            # Libera el subárbol ya procesado
+            element.clear(keep_tail=False)
+
+    parser.close()
+    for _, element in parser.read_events():
+        yield from _element_links(element.tag, element.attrib)
+
+
+def iter_links_soup(html):
+    """BeautifulSoup restringido con SoupStrainer a <a>/<button> (una sola búsqueda)"""
+    features = "lxml" if etree is not None else "html.parser"
+    soup = BeautifulSoup(html, features, parse_only=SoupStrainer(LINK_TAGS))
+    for element in soup.find_all(LINK_TAGS):
+        yield from _element_links(element.name, element.attrs)
+
+
+PARSER_BACKENDS = {
+    "lxml": iter_links_lxml,
+    "soup": iter_links_soup,
+}
+
+
+def get_link_parser(name="lxml"):
+    """Retorna el backend pedido; si lxml no está instalado se usa BeautifulSoup"""
+    if name == "lxml" and etree is None:
+        name = "soup"
+    if name not in PARSER_BACKENDS:
+        raise ValueError(f"Parser desconocido: {name} (opciones: {', '.join(PARSER_BACKENDS)})")
+    return PARSER_BACKENDS[name]
+
+
+def _legacy_links(html):
+    """Implementación anterior: html.parser y dos recorridos completos del árbol"""
+    soup = BeautifulSoup(html, "html.parser")
+    links = [a["href"] for a in soup.find_all("a", href=True)]
+    for btn in soup.find_all(["button", "a"]):
+        data_url = btn.get("data-file") or btn.get("data-url") or btn.get("data-download")
+        if data_url:
+            links.append(data_url)
+    return links
+
+
+def build_directory_listing(entries=20000):
+    """Genera una página tipo 'Index of' grande para el benchmark"""
+    rows = "\n".join(
+        f'<tr><td><a href="file_{i}.pdf">file_{i}.pdf</a></td>'
+        f'<td>2025-01-01 00:00</td><td>{i * 10}K</td>'
+        f'<td><button data-url="/get/file_{i}.zip">Descargar</button></td></tr>'
+        for i in range(entries)
+    )
+    return f"<html><head><title>Index of /files</title></head><body><table>{rows}</table></body></html>"
+
+
+def benchmark(entries=20000, rounds=3):
+    """Compara los backends contra la implementación anterior"""
+    html = build_directory_listing(entries)
+    print(f"Página de {len(html) / 1024 / 1024:.1f} MB con {entries} filas")
+
+    candidates = {"legacy (html.parser x2)": _legacy_links}
+    for name in PARSER_BACKENDS:
+        if name == "lxml" and etree is None:
+            continue
+        backend = PARSER_BACKENDS[name]
+        candidates[name] = lambda html, backend=backend: list(backend(html))
+
+    for name, parse in candidates.items():
+        best = None
+        for _ in range(rounds):
+            start = time.perf_counter()
+            count = len(parse(html))
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        print(f"{name:<25} {best * 1000:9.1f} ms  ({count} enlaces)")
+
+
+if __name__ == '__main__':
+    benchmark()
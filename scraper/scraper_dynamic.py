@@ -1,85 +1,277 @@
-from playwright.sync_api import sync_playwright
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+import asyncio
 import hashlib
-import random
+import json
+from scraper.browser_engine import BrowserEngine
+from utils.helpers import extract_product_key
 from utils.logger import setup_logger
 
 logger = setup_logger("scraper_dynamic")
 
-USER_AGENTS = [
-    "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 "
-    "(KHTML, like Gecko) Chrome/121.0.6167.85 Safari/537.36"
-]
+# MercadoLibre pagina los listados de a 50 resultados
+ITEMS_PER_PAGE = 50
+
+# ============= SELECTORES REALES 2025 =============
+CARD_SELECTOR = "div.ui-search-result__wrapper, li.ui-search-layout__item"
+# Aviso de búsqueda sin resultados ("No hay publicaciones que coincidan...")
+NO_RESULTS_SELECTOR = "div.ui-search-rescue, .ui-search-rescue__title"
+
+# Esquema de extracción: campo -> selector dentro de la tarjeta y atributo(s)
+# a leer ("text" = innerText). Se prueban en orden hasta obtener un valor.
+CARD_SCHEMA = {
+    # TÍTULO: viene dentro del <a class="poly-component__title">
+    "title": {"selector": "a.poly-component__title", "attr": "text"},
+    "url": {"selector": "a.poly-component__title", "attr": "href"},
+    # PRECIO: es el mismo selector de siempre
+    "price": {"selector": "span.andes-money-amount__fraction", "attr": "text"},
+    # IMAGEN (src o data-src)
+    "image_url": {"selector": "img", "attr": ["data-src", "src"]},
+}
+# =================================================
+
+# Campos que forman la huella de contenido. page_number y category quedan
+# afuera: la posición en el listado y el término de búsqueda por el que se
+# encontró cambian entre ejecuciones sin que cambie el producto
+FINGERPRINT_FIELDS = (
+    "title", "price", "original_price", "discount_percentage", "quantity",
+    "url", "image_url", "description",
+)
+
+# Extrae todas las tarjetas en una sola llamada al navegador
+EXTRACT_CARDS_JS = """
+(cards, schema) => cards.map(card => {
+    const out = {};
+    for (const [name, spec] of Object.entries(schema)) {
+        const el = spec.selector ? card.querySelector(spec.selector) : card;
+        let value = null;
+        if (el) {
+            const attrs = Array.isArray(spec.attr) ? spec.attr : [spec.attr || "text"];
+            for (const attr of attrs) {
+                value = attr === "text" ? el.innerText : el.getAttribute(attr);
+                if (value) break;
+            }
+        }
+        out[name] = value || null;
+    }
+    return out;
+})
+"""
+
+class ListingNotLoaded(Exception):
+    """El listado no apareció y tampoco el aviso de sin resultados (captcha, bloqueo, demora)"""
+
+
+def completed_terms(outcome):
+    """Términos sin páginas fallidas y con productos en la página 1"""
+    # Solo esos se pueden reconciliar: a los demás les faltarían productos.
+    # Una página 1 vacía tampoco alcanza para dar por desaparecida toda la categoría
+    failed = {term for (term, _), result in outcome.items() if isinstance(result, Exception)}
+    empty = {term for (term, page_number), result in outcome.items() if page_number == 1 and result == 0}
+    return {term for term, _ in outcome} - failed - empty
 
 class DynamicScraper:
-    def __init__(self, headless=True):
+    def __init__(self, headless=True, concurrency=4, engine=None,
+                 card_selector=CARD_SELECTOR, card_schema=None, results_timeout=15000):
         self.headless = headless
+        self.results_timeout = results_timeout
+        self.concurrency = max(1, concurrency)
+        self.card_selector = card_selector
+        self.card_schema = card_schema or CARD_SCHEMA
+        # El motor mantiene Chromium vivo entre ejecuciones
+        self.engine = engine or BrowserEngine(headless=headless, max_contexts=self.concurrency)
 
     def calculate_hash(self, text):
         return hashlib.sha256(text.encode("utf-8")).hexdigest()
 
-    def scrape_mercadolibre(self, search_term="laptop"):
-        items = []
+    def fingerprint(self, item):
+        """Huella de contenido sobre todos los campos extraídos"""
+        values = [item.get(field) for field in FINGERPRINT_FIELDS]
+        return self.calculate_hash(json.dumps(values, ensure_ascii=False, default=str))
 
-        with sync_playwright() as p:
-            browser = p.chromium.launch(
-                headless=self.headless,
-                args=["--disable-dev-shm-usage", "--no-sandbox"]
-            )
+    def build_listing_url(self, search_term, page_number=1):
+        slug = "-".join(search_term.split())
+        if page_number <= 1:
+            return f"https://listado.mercadolibre.com.ar/{slug}"
+        offset = (page_number - 1) * ITEMS_PER_PAGE + 1
+        return f"https://listado.mercadolibre.com.ar/{slug}_Desde_{offset}_NoIndex_True"
 
-            context = browser.new_context(
-                user_agent=random.choice(USER_AGENTS),
-                locale="es-AR"
-            )
-            page = context.new_page()
+    def build_item(self, card, search_term, page_number):
+        """Convierte una tarjeta extraída en el registro de producto"""
+        title = (card.get("title") or "").strip()
+        if not title:
+            return None
 
-            url = f"https://listado.mercadolibre.com.ar/{search_term}"
+        price = None
+        raw = (card.get("price") or "").replace(".", "").strip()
+        if raw.isdigit():
+            price = float(raw)
+
+        # El fragmento (#polycard_client=...) lleva datos de tracking que
+        # cambian en cada visita; el wid= que trae se usa antes de quitarlo
+        raw_url = card.get("url") or ""
+        product_key = extract_product_key(raw_url)
+        url = raw_url.split("#")[0] or None
+
+        # Las imágenes diferidas traen un placeholder data: hasta cargarse
+        image_url = card.get("image_url")
+        if image_url and image_url.startswith("data:"):
+            image_url = None
+
+        # Los campos extra del esquema se conservan tal cual
+        item = dict(card)
+        item.update({
+            "title": title,
+            "price": price,
+            "url": url,
+            "image_url": image_url,
+            "description": (card.get("description") or title)[:120],
+            "category": search_term,
+            "page_number": page_number,
+        })
+        # Identidad estable (id del ítem o URL) + huella de contenido para
+        # detectar cambios. Sin URL, el título solo no alcanza: dos productos
+        # distintos pueden llamarse igual
+        item["product_key"] = product_key or self.calculate_hash(f"{title}|{image_url or ''}")
+        item["data_hash"] = self.fingerprint(item)
+        return item
+
+    def build_items(self, cards, search_term, page_number):
+        """Convierte las tarjetas de una página, descartando las incompletas"""
+        items = []
+        for card in cards:
+            item = self.build_item(card, search_term, page_number)
+            if item:
+                items.append(item)
+        return items
+
+    async def _fetch_listing(self, search_term, page_number):
+        """Carga una página de listado y retorna las tarjetas sin procesar"""
+        async with self.engine.page() as page:
+            url = self.build_listing_url(search_term, page_number)
             logger.info(f"🌍 Cargando página: {url}")
 
-            page.goto(url, timeout=120000, wait_until="load")
-            page.wait_for_timeout(2500)
+            await page.goto(url, timeout=120000, wait_until="domcontentloaded")
+
+            # Se espera al listado en lugar de una pausa fija. Si no aparece,
+            # la página solo cuenta como vacía con el aviso de sin resultados;
+            # si no, es una falla (captcha, bloqueo o carga lenta)
+            try:
+                await page.wait_for_selector(
+                    self.card_selector, state="attached", timeout=self.results_timeout
+                )
+            except PlaywrightTimeoutError:
+                if await page.query_selector(NO_RESULTS_SELECTOR) is None:
+                    raise ListingNotLoaded(f"El listado no cargó en {url}")
+                logger.info(f"Sin resultados en {url}")
+                return []
 
             # ESTE selector sí existe en tu screenshot
-            products = page.query_selector_all("div.ui-search-result__wrapper, li.ui-search-layout__item")
-            logger.info(f"✔ Detectados {len(products)} items")
+            cards = await page.eval_on_selector_all(
+                self.card_selector, EXTRACT_CARDS_JS, self.card_schema
+            )
+            logger.info(f"✔ Detectados {len(cards)} items ({search_term}, página {page_number})")
 
-            for p in products:
+        return cards
 
-                # ============= SELECTORES REALES 2025 =============
-                # TÍTULO: viene dentro del <a class="poly-component__title">
-                title_el = p.query_selector("a.poly-component__title")
-                if not title_el:
+    async def _scrape_listing(self, search_term, page_number):
+        """Extrae los productos de una página de listado"""
+        cards = await self._fetch_listing(search_term, page_number)
+        return self.build_items(cards, search_term, page_number)
+
+    async def _crawl(self, pages, sink=None, stop_on_empty=True):
+        items = []
+        # (término, página) -> tarjetas encontradas, o la excepción si falló
+        outcome = {}
+        queue = asyncio.Queue()
+        loop = asyncio.get_running_loop()
+        # Primera página vacía por término: las siguientes no se visitan
+        exhausted = {}
+
+        for task in pages:
+            queue.put_nowait(task)
+
+        async def worker():
+            while True:
+                try:
+                    term, page_number = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+
+                if stop_on_empty and page_number > exhausted.get(term, page_number):
                     continue
 
-                title = title_el.inner_text().strip()
-                url_item = title_el.get_attribute("href")
-
-                # PRECIO: es el mismo selector de siempre
-                price_el = p.query_selector("span.andes-money-amount__fraction")
-                price = None
-                if price_el:
-                    raw = price_el.inner_text().replace(".", "")
-                    if raw.isdigit():
-                        price = float(raw)
-
-                # IMAGEN (src o data-src)
-                img_el = p.query_selector("img")
-                image = None
-                if img_el:
-                    image = img_el.get_attribute("data-src") or img_el.get_attribute("src")
-
-                # =================================================
-
-                items.append({
-                    "title": title,
-                    "price": price,
-                    "url": url_item,
-                    "image_url": image,
-                    "description": title[:120],
-                    "category": search_term,
-                    "data_hash": self.calculate_hash(title + str(price)),
-                })
-
-            browser.close()
-
-        logger.info(f"🎉 TOTAL EXTRAÍDOS: {len(items)}")
+                try:
+                    cards = await self._fetch_listing(term, page_number)
+                except Exception as e:
+                    logger.error(f"Error scrapeando {term} (página {page_number}): {e}")
+                    outcome[(term, page_number)] = e
+                    continue
+
+                outcome[(term, page_number)] = len(cards)
+                if not cards:
+                    exhausted[term] = min(exhausted.get(term, page_number), page_number)
+                    continue
+
+                if sink is None:
+                    items.extend(self.build_items(cards, term, page_number))
+                    continue
+
+                try:
+                    # El consumidor bloquea si su cola está llena: se espera en
+                    # un hilo para no frenar al resto de las páginas en curso
+                    await loop.run_in_executor(None, sink, (term, page_number, cards))
+                except Exception as e:
+                    # El consumidor ya no acepta páginas (p. ej. el pipeline
+                    # abortó): no se carga ninguna más
+                    outcome[(term, page_number)] = e
+                    while not queue.empty():
+                        queue.get_nowait()
+                    raise
+
+        workers = min(self.concurrency, queue.qsize()) or 1
+        tasks = [asyncio.ensure_future(worker()) for _ in range(workers)]
+        try:
+            await asyncio.gather(*tasks)
+        except BaseException:
+            # Las páginas en curso se cancelan y sus contextos vuelven al motor
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+
+        return items, outcome
+
+    def listing_pages(self, search_terms, max_pages=1):
+        """Páginas (término, página) a recorrer: primero la 1 de cada término, luego la 2, etc."""
+        if isinstance(search_terms, str):
+            search_terms = [search_terms]
+        return [
+            (term, page_number)
+            for page_number in range(1, max(1, max_pages) + 1)
+            for term in search_terms
+        ]
+
+    def crawl(self, search_terms, max_pages=1, sink=None):
+        """Recorre varias páginas de varios términos con un pool acotado de contextos"""
+        # Con `sink` cada página se entrega como (término, página, tarjetas) apenas
+        # se carga, en lugar de acumular los productos y retornarlos al final
+        pages = self.listing_pages(search_terms, max_pages)
+        items, _ = self.engine.run(self._crawl(pages, sink))
+
+        if sink is None:
+            logger.info(f"🎉 TOTAL EXTRAÍDOS: {len(items)}")
         return items
+
+    def crawl_pages(self, pages, sink, stop_on_empty=False):
+        """Carga páginas (término, página) y retorna el resultado de cada una"""
+        # outcome: (término, página) -> tarjetas encontradas o la excepción;
+        # con stop_on_empty las páginas posteriores a una vacía no aparecen
+        _, outcome = self.engine.run(self._crawl(list(pages), sink, stop_on_empty=stop_on_empty))
+        return outcome
+
+    def scrape_mercadolibre(self, search_term="laptop", max_pages=1):
+        return self.crawl([search_term], max_pages=max_pages)
+
+    def close(self):
+        """Libera el navegador persistente"""
+        self.engine.close()
@@ -1,10 +1,14 @@
 import requests
-from bs4 import BeautifulSoup
 import hashlib
 import os
 import re
+import threading
 import time
-from urllib.parse import urljoin
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin, urlsplit, urlunsplit
+from scraper.link_parsers import get_link_parser
+from scraper.validator_cache import ValidatorCache
+from utils.helpers import calculate_file_hash
 from utils.logger import setup_logger
 
 logger = setup_logger('scraper_static')
@@ -15,88 +19,272 @@ FILE_EXTENSIONS = [
     ".doc", ".docx", ".xls", ".xlsx"
 ]
 
+# Extensión al final del path de la URL, en una sola expresión compilada
+FILE_EXTENSION_RE = re.compile(
+    r"(" + "|".join(re.escape(ext) for ext in FILE_EXTENSIONS) + r")$",
+    re.IGNORECASE
+)
+
+SCRIPT_URL_RE = re.compile(r'https?://[^\s"\']+')
+
+DEFAULT_PORTS = {"http": 80, "https": 443}
+
+# Tamaño de bloque para escribir y hashear las descargas en streaming
+CHUNK_SIZE = 1024 * 1024
+
+
+def normalize_url(url):
+    """Normaliza una URL para deduplicar (esquema/host en minúsculas, sin fragmento ni puerto por defecto)"""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    if parts.port and parts.port != DEFAULT_PORTS.get(scheme):
+        host = f"{host}:{parts.port}"
+    return urlunsplit((scheme, host, parts.path or "/", parts.query, ""))
+
+
+def classify_url(url):
+    """Retorna la extensión de archivo de la URL o None si no es descargable"""
+    match = FILE_EXTENSION_RE.search(urlsplit(url).path)
+    return match.group(1).lower() if match else None
+
+
+class LinkCollector:
+    """Cola de URLs únicas a descargar, con contadores de duplicados"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url
+        self.links = []
+        self.found = 0
+        self.duplicates = 0
+        self.by_type = {}
+        self._seen = set()
+
+    def add(self, raw_url):
+        try:
+            url = normalize_url(urljoin(self.base_url, raw_url))
+        except ValueError:
+            return False
+
+        ext = classify_url(url)
+        if not ext:
+            return False
+
+        self.found += 1
+        if url in self._seen:
+            self.duplicates += 1
+            return False
+
+        self._seen.add(url)
+        self.links.append(url)
+        self.by_type[ext] = self.by_type.get(ext, 0) + 1
+        return True
+
+    def stats(self):
+        return {
+            "found": self.found,
+            "unique": len(self.links),
+            "duplicates": self.duplicates,
+            "by_type": dict(self.by_type),
+        }
+
 class StaticScraper:
-    def __init__(self, download_dir='downloads'):
+    def __init__(self, download_dir='downloads', max_workers=4, parser='lxml'):
         self.download_dir = download_dir
+        self.max_workers = max(1, max_workers)
+        self.link_parser = get_link_parser(parser)
         os.makedirs(download_dir, exist_ok=True)
 
-        self.session = requests.Session()
-        self.session.headers.update({
+        # Validadores HTTP y descargas parciales persisten entre ejecuciones
+        cache_dir = os.path.join(download_dir, '.cache')
+        self.partial_dir = os.path.join(cache_dir, 'partial')
+        os.makedirs(self.partial_dir, exist_ok=True)
+        self.cache = ValidatorCache(os.path.join(cache_dir, 'validators.json'))
+
+        self.session = self._new_session()
+        # requests.Session no es thread-safe: una sesión por hilo de descarga
+        self._local = threading.local()
+        self._url_locks = {}
+        self._locks_guard = threading.Lock()
+        self.last_discovery_stats = {}
+
+    def _new_session(self):
+        session = requests.Session()
+        session.headers.update({
             "User-Agent": "Mozilla/5.0 (Windows NT 10.0)"
         })
+        return session
+
+    def _thread_session(self):
+        if not hasattr(self._local, "session"):
+            self._local.session = self._new_session()
+        return self._local.session
 
     def calculate_hash(self, content):
         return hashlib.sha256(content).hexdigest()
 
+    def _url_lock(self, url):
+        # Evita que dos hilos descarguen la misma URL sobre el mismo parcial
+        with self._locks_guard:
+            return self._url_locks.setdefault(url, threading.Lock())
+
+    def _partial_path(self, url):
+        name = hashlib.sha256(url.encode("utf-8")).hexdigest()[:32]
+        return os.path.join(self.partial_dir, f"{name}.part")
+
+    def _is_local_copy_valid(self, cached, filepath):
+        """La copia local solo sirve para un 304 si sigue existiendo y con el mismo tamaño"""
+        record = cached.get("file")
+        if not record or not os.path.isfile(filepath):
+            return False
+        return os.path.getsize(filepath) == record.get("file_size")
+
     def download_file(self, url, suggested_name=None):
+        """Descarga un archivo de forma condicional y reanudable"""
+        with self._url_lock(url):
+            return self._download(url, suggested_name)
+
+    def _download(self, url, suggested_name=None, resume=True):
         try:
             logger.info(f"Descargando archivo: {url}")
 
-            response = self.session.get(url, timeout=30)
-            response.raise_for_status()
-
             # Determinar nombre del archivo
             filename = suggested_name or url.split("/")[-1].split("?")[0]
             if not filename:
                 filename = f"file_{int(time.time())}"
 
             filepath = os.path.join(self.download_dir, filename)
+            part_path = self._partial_path(url)
+            cached = self.cache.get(url) or {}
+            headers = {}
 
-            with open(filepath, "wb") as f:
-                f.write(response.content)
+            # Petición condicional: si no cambió, el servidor responde 304
+            if self._is_local_copy_valid(cached, filepath):
+                if cached.get("etag"):
+                    headers["If-None-Match"] = cached["etag"]
+                if cached.get("last_modified"):
+                    headers["If-Modified-Since"] = cached["last_modified"]
 
-            return {
-                "filename": filename,
-                "file_path": filepath,
-                "file_type": response.headers.get("Content-Type", "unknown"),
-                "file_size": len(response.content),
-                "file_hash": self.calculate_hash(response.content),
-                "download_url": url,
-            }
+            # Reanudar una descarga interrumpida si el servidor puede validarla
+            offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+            partial = cached.get("partial") or {}
+            validator = partial.get("etag") or partial.get("last_modified")
+            if resume and offset and validator:
+                headers["Range"] = f"bytes={offset}-"
+                headers["If-Range"] = validator
+            else:
+                offset = 0
+
+            with self._thread_session().get(url, headers=headers, timeout=30, stream=True) as response:
+                if response.status_code == 304:
+                    logger.info(f"Sin cambios (304): {url}")
+                    if os.path.exists(part_path):
+                        os.remove(part_path)
+                    self.cache.update(url, partial=None)
+                    return dict(cached["file"], not_modified=True)
+
+                if response.status_code == 416 and offset:
+                    # El parcial no corresponde al recurso (p. ej. es más largo
+                    # que el archivo actual): se descarta y se reintenta una
+                    # sola vez sin Range
+                    logger.warning(f"Rango no satisfacible (416) para {url}, se descarga completo")
+                    if os.path.exists(part_path):
+                        os.remove(part_path)
+                    self.cache.update(url, partial=None)
+                    return self._download(url, suggested_name, resume=False)
+
+                response.raise_for_status()
+
+                etag = response.headers.get("ETag")
+                last_modified = response.headers.get("Last-Modified")
+                self.cache.update(url, partial={"etag": etag, "last_modified": last_modified})
+
+                sha256 = hashlib.sha256()
+                if response.status_code == 206 and offset:
+                    logger.info(f"Reanudando {url} desde el byte {offset}")
+                    mode = "ab"
+                    with open(part_path, "rb") as f:
+                        for block in iter(lambda: f.read(CHUNK_SIZE), b""):
+                            sha256.update(block)
+                    size = offset
+                else:
+                    mode = "wb"
+                    size = 0
+
+                # Se escribe al parcial y se renombra al terminar, así una
+                # descarga cortada nunca deja un archivo a medias
+                with open(part_path, mode) as f:
+                    for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                        if chunk:
+                            f.write(chunk)
+                            sha256.update(chunk)
+                            size += len(chunk)
+
+                os.replace(part_path, filepath)
+
+                record = {
+                    "filename": filename,
+                    "file_path": filepath,
+                    "file_type": response.headers.get("Content-Type", "unknown"),
+                    "file_size": size,
+                    "file_hash": sha256.hexdigest(),
+                    "download_url": url,
+                }
+
+            self.cache.update(
+                url,
+                etag=etag,
+                last_modified=last_modified,
+                content_length=size,
+                file=record,
+                partial=None
+            )
+            return record
 
         except Exception as e:
             logger.error(f"Error descargando {url}: {e}")
             return None
 
+    def download_files(self, urls):
+        """Descarga varias URLs en paralelo con un pool de hilos acotado"""
+        if not urls:
+            return []
+
+        with ThreadPoolExecutor(max_workers=min(self.max_workers, len(urls))) as executor:
+            results = executor.map(self.download_file, urls)
+            return [file for file in results if file]
+
+    def discover_links(self, html, base_url):
+        """Recorre la página y arma la cola de URLs de archivos sin repetir"""
+        collector = LinkCollector(base_url)
+
+        # 1 y 2. Enlaces <a href=""> y botones con data-file/data-url/data-download,
+        # en una sola pasada del parser configurado
+        for link in self.link_parser(html):
+            collector.add(link)
+
+        # 3. Detectar URLs escondidas dentro de scripts con regex
+        for link in SCRIPT_URL_RE.findall(html):
+            collector.add(link)
+
+        return collector
+
     def scrape_static_page(self, url):
         try:
             logger.info(f"Scrapeando página estática: {url}")
             response = self.session.get(url, timeout=30)
             response.raise_for_status()
 
-            soup = BeautifulSoup(response.text, "html.parser")
-            found_files = []
-
-            # 1. Detectar archivos directos en <a href="">
-            for a in soup.find_all("a", href=True):
-                href = urljoin(url, a["href"])
-
-                if any(ext in href.lower() for ext in FILE_EXTENSIONS):
-                    file = self.download_file(href)
-                    if file:
-                        found_files.append(file)
-
-            # 2. Detectar botones con data-file o data-url
-            for btn in soup.find_all(["button", "a"]):
-                data_url = (
-                    btn.get("data-file")
-                    or btn.get("data-url")
-                    or btn.get("data-download")
-                )
-                if data_url:
-                    download_link = urljoin(url, data_url)
-                    if any(ext in download_link.lower() for ext in FILE_EXTENSIONS):
-                        file = self.download_file(download_link)
-                        if file:
-                            found_files.append(file)
-
-            # 3. Detectar URLs escondidas dentro de scripts con regex
-            script_links = re.findall(r'https?://[^\s"\']+', response.text)
-            for link in script_links:
-                if any(ext in link.lower() for ext in FILE_EXTENSIONS):
-                    file = self.download_file(link)
-                    if file:
-                        found_files.append(file)
+            collector = self.discover_links(response.text, url)
+            stats = collector.stats()
+            logger.info(
+                f"Enlaces detectados: {stats['found']}, únicos: {stats['unique']}, "
+                f"duplicados descartados: {stats['duplicates']}"
+            )
+            self.last_discovery_stats = stats
+
+            # 4. Descargar en paralelo
+            found_files = self.download_files(collector.links)
 
             logger.info(f"Total de archivos descargados: {len(found_files)}")
             return found_files
@@ -109,11 +297,11 @@ class StaticScraper:
         local = {}
         for filename in os.listdir(self.download_dir):
             path = os.path.join(self.download_dir, filename)
-            with open(path, 'rb') as f:
-                data = f.read()
+            if not os.path.isfile(path) or filename.endswith(".part"):
+                continue
             local[filename] = {
                 "path": path,
-                "hash": self.calculate_hash(data),
-                "size": len(data)
+                "hash": calculate_file_hash(path),
+                "size": os.path.getsize(path)
             }
         return local
@@ -0,0 +1,49 @@
+import json
+import os
+import threading
+from utils.logger import setup_logger
+
+logger = setup_logger('validator_cache')
+
+
+class ValidatorCache:
+    """Cache persistente de validadores HTTP (ETag, Last-Modified, tamaño) por URL"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            logger.warning(f"Cache de validadores ilegible, se descarta: {e}")
+            return {}
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self._entries, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    def get(self, url):
+        """Retorna una copia de la entrada de una URL (o None)"""
+        with self._lock:
+            entry = self._entries.get(url)
+            return dict(entry) if entry else None
+
+    def update(self, url, **fields):
+        """Actualiza campos de una entrada; un valor None elimina el campo"""
+        with self._lock:
+            entry = self._entries.setdefault(url, {})
+            for key, value in fields.items():
+                if value is None:
+                    entry.pop(key, None)
+                else:
+                    entry[key] = value
+            self._save()
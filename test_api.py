@@ -38,10 +38,16 @@ def main():
         ('/api/health', 'Health Check'),
         ('/api/products', 'Get All Products'),
         ('/api/products?page=1&limit=10', 'Get Products with Pagination'),
+        ('/api/products?cursor=&limit=10', 'Get Products with Cursor'),
+        ('/api/products?limit=10&count=estimate', 'Get Products with Estimated Total'),
         ('/api/files', 'Get All Files'),
         ('/api/events', 'Get Events'),
+        ('/api/products/search?q=notebook', 'Search Products'),
+        ('/api/products/search?q=notbook', 'Search Products (typo)'),
         ('/api/stats', 'Get Statistics'),
         ('/api/categories', 'Get Categories'),
+        ('/api/categories/laptop/stats', 'Get Category Stats'),
+        ('/api/snapshots/results', 'Get Results Snapshot'),
     ]
     
     results = []
@@ -0,0 +1,247 @@
+import json
+import os
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from utils.json_generator import StreamingJSONWriter
+from utils.serialization import json_default
+from utils.logger import setup_logger
+
+try:
+    import fcntl
+except ImportError:  # Windows: sin lock entre procesos
+    fcntl = None
+
+logger = setup_logger('delta_exporter')
+
+# Tabla y columna de marca de agua de cada artefacto
+DELTA_ARTIFACTS = {
+    'results': {'table': 'scraped_data', 'column': 'last_modified', 'active_only': True},
+    'files': {'table': 'scraped_files', 'column': 'last_modified', 'active_only': True},
+    'events': {'table': 'scraping_events', 'column': 'event_date', 'active_only': False},
+}
+
+
+class DeltaExporter:
+    """Exportación incremental: base compactada + segmentos delta + manifest"""
+
+    # Cada artefacto vive en data/delta/<nombre>/. Los segmentos contienen las
+    # filas con (columna, id) mayor que la marca de agua anterior, incluidas las
+    # desactivadas, así un consumidor solo descarga lo que cambió desde su
+    # última sincronización.
+    #
+    # La columna toma CURRENT_TIMESTAMP, que es el inicio de la transacción y
+    # no su commit: una escritura larga puede aparecer después con una marca
+    # anterior a la ya exportada. Por eso cada delta vuelve a leer una ventana
+    # de lag_seconds hacia atrás y descarta las filas (id, marca) ya escritas.
+
+    def __init__(self, db, data_dir='data/delta', compact_every=24, itersize=2000, lag_seconds=300):
+        self.db = db
+        self.data_dir = data_dir
+        self.compact_every = compact_every
+        self.itersize = itersize
+        self.lag_seconds = lag_seconds
+
+    def _dir(self, name):
+        path = os.path.join(self.data_dir, name)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def _manifest_path(self, name):
+        return os.path.join(self._dir(name), 'manifest.json')
+
+    def load_manifest(self, name):
+        path = self._manifest_path(name)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    @contextmanager
+    def _locked(self, name):
+        """Una sola exportación por artefacto a la vez, también entre procesos"""
+        with open(os.path.join(self._dir(name), '.lock'), 'w') as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _save_manifest(self, name, manifest):
+        directory = self._dir(name)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, ensure_ascii=False, indent=2)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, self._manifest_path(name))
+
+    def _write_rows(self, name, filename, query, params, column, recent, cutoff=None):
+        """Escribe un segmento NDJSON y retorna (filas, última marca de agua)"""
+        # recent: id -> marca de las filas ya exportadas dentro de la ventana
+        writer = StreamingJSONWriter(os.path.join(self._dir(name), filename), 'ndjson')
+        watermark = None
+        try:
+            for row in self.db.iter_query(query, params, itersize=self.itersize):
+                ts = json_default(row[column])
+                key = str(row['id'])
+                if recent.get(key) == ts:
+                    continue
+                writer.write(row)
+                watermark = {'ts': ts, 'id': row['id']}
+                if cutoff is None or row[column] >= cutoff:
+                    recent[key] = ts
+        except Exception:
+            writer.abort()
+            raise
+
+        if writer.count == 0:
+            writer.abort()
+        else:
+            writer.close()
+        return writer.count, watermark
+
+    def _prune_recent(self, recent, watermark):
+        """Deja solo las filas que la próxima ventana puede volver a leer"""
+        if not watermark:
+            return {}
+        cutoff = (datetime.fromisoformat(watermark['ts']) - timedelta(seconds=self.lag_seconds)).isoformat()
+        return {key: ts for key, ts in recent.items() if ts >= cutoff}
+
+    def compact(self, name):
+        """Reescribe la base completa; la generación anterior se conserva un ciclo"""
+        with self._locked(name):
+            return self._compact(name)
+
+    def _compact(self, name):
+        spec = DELTA_ARTIFACTS[name]
+        table, column = spec['table'], spec['column']
+        previous = self.load_manifest(name) or {}
+        seq = previous.get('next_seq', 1)
+
+        # La marca de agua se fija antes de exportar: lo que cambie durante la
+        # exportación entra en el siguiente delta
+        top = self.db.execute_query(
+            f"SELECT {column} AS ts, id FROM {table} ORDER BY {column} DESC, id DESC LIMIT 1",
+            fetch=True
+        )
+        watermark = {'ts': json_default(top[0]['ts']), 'id': top[0]['id']} if top else None
+
+        conditions = []
+        params = ()
+        if spec['active_only']:
+            conditions.append("is_active = TRUE")
+        if watermark:
+            conditions.append(f"({column}, id) <= (%s, %s)")
+            params = (watermark['ts'], watermark['id'])
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        filename = f'base-{seq:06d}.ndjson'
+        query = f"SELECT * FROM {table} {where} ORDER BY {column}, id"
+        recent = {}
+        cutoff = None
+        if watermark:
+            cutoff = datetime.fromisoformat(watermark['ts']) - timedelta(seconds=self.lag_seconds)
+        rows, _ = self._write_rows(name, filename, query, params, column, recent, cutoff)
+
+        manifest = {
+            'artifact': name,
+            'watermark_column': column,
+            'watermark': watermark,
+            'base': {
+                'file': filename if rows else None,
+                'seq': seq,
+                'rows': rows,
+                'watermark': watermark,
+                'created': datetime.now().isoformat()
+            },
+            'segments': [],
+            'recent': recent,
+            'next_seq': seq + 1
+        }
+        self._save_manifest(name, manifest)
+        self._cleanup(name, manifest, previous)
+
+        logger.info(f"{name}: base compactada con {rows} filas")
+        return rows
+
+    def export_delta(self, name):
+        """Agrega un segmento con lo que cambió desde la última marca de agua"""
+        with self._locked(name):
+            manifest = self.load_manifest(name)
+            if manifest is None or len(manifest['segments']) >= self.compact_every:
+                return self._compact(name)
+            return self._export_delta(name, manifest)
+
+    def _export_delta(self, name, manifest):
+        spec = DELTA_ARTIFACTS[name]
+        table, column = spec['table'], spec['column']
+        since = manifest['watermark']
+        seq = manifest['next_seq']
+
+        if since:
+            query = f"""
+            SELECT * FROM {table}
+            WHERE {column} >= %s::timestamp - %s * INTERVAL '1 second'
+            ORDER BY {column}, id
+            """
+            params = (since['ts'], self.lag_seconds)
+        else:
+            query = f"SELECT * FROM {table} ORDER BY {column}, id"
+            params = ()
+
+        filename = f'delta-{seq:06d}.ndjson'
+        recent = manifest.get('recent', {})
+        rows, last = self._write_rows(name, filename, query, params, column, recent)
+
+        if rows == 0:
+            logger.info(f"{name}: sin cambios desde la última exportación")
+            return 0
+
+        # Una fila tardía de la ventana no hace retroceder la marca de agua
+        watermark = since
+        if since is None or (last['ts'], last['id']) > (since['ts'], since['id']):
+            watermark = last
+
+        manifest['segments'].append({
+            'file': filename,
+            'seq': seq,
+            'rows': rows,
+            'since': since,
+            'until': watermark,
+            'created': datetime.now().isoformat()
+        })
+        manifest['watermark'] = watermark
+        manifest['recent'] = self._prune_recent(recent, watermark)
+        manifest['next_seq'] = seq + 1
+        self._save_manifest(name, manifest)
+
+        logger.info(f"{name}: segmento {filename} con {rows} filas")
+        return rows
+
+    def _cleanup(self, name, manifest, previous):
+        """Borra bases y segmentos que no referencia el manifest actual ni el anterior"""
+        # Un consumidor que leyó el manifest anterior todavía puede estar
+        # descargando sus archivos: se borran recién en la compactación siguiente
+        keep = set()
+        for generation in (manifest, previous):
+            if generation.get('base', {}).get('file'):
+                keep.add(generation['base']['file'])
+            keep.update(segment['file'] for segment in generation.get('segments', []))
+
+        directory = self._dir(name)
+        for filename in os.listdir(directory):
+            if filename.endswith('.ndjson') and filename not in keep:
+                os.remove(os.path.join(directory, filename))
+
+    def export_all(self):
+        """Exporta el delta de todos los artefactos"""
+        results = {}
+        for name in DELTA_ARTIFACTS:
+            try:
+                results[name] = self.export_delta(name)
+            except Exception as e:
+                logger.error(f"Error en exportación incremental de {name}: {e}")
+                results[name] = None
+        return results
@@ -1,6 +1,7 @@
 import hashlib
 import json
 import os
+import re
 from datetime import datetime
 
 def calculate_file_hash(filepath):
@@ -8,7 +9,7 @@ def calculate_file_hash(filepath):
     sha256_hash = hashlib.sha256()
     
     with open(filepath, "rb") as f:
-        for byte_block in iter(lambda: f.read(4096), b""):
+        for byte_block in iter(lambda: f.read(1024 * 1024), b""):
             sha256_hash.update(byte_block)
     
     return sha256_hash.hexdigest()
@@ -28,6 +29,30 @@ def load_json(filepath):
     with open(filepath, 'r', encoding='utf-8') as f:
         return json.load(f)
 
+# Id de publicación de MercadoLibre (wid=MLA123..., /MLA-123...-titulo, /p/MLA123...)
+ML_WID_RE = re.compile(r'[?#&]wid=(ML[A-Z])(\d+)')
+ML_ITEM_RE = re.compile(r'/(ML[A-Z])-(\d+)')
+ML_CATALOG_RE = re.compile(r'/p/(ML[A-Z])(\d+)')
+
+# Largo de product_key en la BD
+PRODUCT_KEY_MAX_LENGTH = 200
+
+def extract_product_key(url):
+    """Identidad estable de un producto: id de MercadoLibre o la URL sin fragmento"""
+    if not url:
+        return None
+    for pattern in (ML_WID_RE, ML_ITEM_RE, ML_CATALOG_RE):
+        match = pattern.search(url)
+        if match:
+            return f"{match.group(1)}{match.group(2)}"
+    # Sin id, la query puede ser la identidad (p. ej. los enlaces patrocinados
+    # click1.../count?a=...): solo se quita el fragmento de tracking. Las URLs
+    # largas se resumen en un hash en lugar de truncarse y chocar entre sí
+    key = url.split('#')[0]
+    if len(key) > PRODUCT_KEY_MAX_LENGTH:
+        return hashlib.sha256(key.encode('utf-8')).hexdigest()
+    return key
+
 def format_price(price):
     """Formatea un precio a string"""
     if price is None:
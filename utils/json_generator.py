@@ -1,67 +1,103 @@
-import json
 import os
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from database.db_manager import DatabaseManager
 from utils.logger import setup_logger
-from datetime import datetime
-from decimal import Decimal
+from utils.serialization import dumps
 import time
 
 logger = setup_logger('json_generator')
 db = DatabaseManager()
 
+# Formatos de salida: pretty (indent=2), compact (una línea) o ndjson (un objeto por línea)
+EXPORT_FORMATS = ('pretty', 'compact', 'ndjson')
+
+
+class StreamingJSONWriter:
+    """Escribe filas de a una en un temporal y lo renombra al cerrar"""
+
+    def __init__(self, path, fmt='pretty'):
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"Formato desconocido: {fmt} (opciones: {', '.join(EXPORT_FORMATS)})")
+        self.path = path
+        self.fmt = fmt
+        self.count = 0
+
+        directory = os.path.dirname(path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        fd, self.tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        self._file = os.fdopen(fd, 'wb')
+
+        if fmt != 'ndjson':
+            self._file.write(b'[')
+
+    def write(self, row):
+        if self.fmt == 'pretty':
+            prefix = b'\n  ' if self.count == 0 else b',\n  '
+            self._file.write(prefix + dumps(row, pretty=True).replace(b'\n', b'\n  '))
+        elif self.fmt == 'compact':
+            text = dumps(row)
+            self._file.write(text if self.count == 0 else b',' + text)
+        else:
+            self._file.write(dumps(row) + b'\n')
+        self.count += 1
+
+    def close(self):
+        """Cierra el archivo y lo publica de forma atómica"""
+        if self.fmt == 'pretty':
+            self._file.write(b'\n]' if self.count else b']')
+        elif self.fmt == 'compact':
+            self._file.write(b']')
+        self._file.close()
+        os.chmod(self.tmp_path, 0o644)
+        os.replace(self.tmp_path, self.path)
+
+    def abort(self):
+        """Descarta el temporal sin tocar el archivo publicado"""
+        self._file.close()
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
 class JSONGenerator:
-    def __init__(self):
+    def __init__(self, fmt=None, ndjson=None, itersize=None):
         self.data_dir = 'data'
         os.makedirs(self.data_dir, exist_ok=True)
-    
-    def datetime_converter(self, obj):
-        """Convierte objetos datetime a string"""
-        if isinstance(obj, datetime):
-            return obj.isoformat()
-        return obj
-    
-    def decimal_converter(self, obj):
-        """Convierte objetos Decimal a float o int"""
-        if isinstance(obj, Decimal):
-            # Convertir a float manteniendo 2 decimales
-            return float(round(obj, 2))
-        return obj
-    
-    def safe_serialize(self, obj):
-        """Serializa objetos de forma segura para JSON"""
-        if isinstance(obj, datetime):
-            return obj.isoformat()
-        elif isinstance(obj, Decimal):
-            return float(round(obj, 2))
-        elif isinstance(obj, dict):
-            return {k: self.safe_serialize(v) for k, v in obj.items()}
-        elif isinstance(obj, list):
-            return [self.safe_serialize(item) for item in obj]
-        elif hasattr(obj, '__dict__'):
-            return self.safe_serialize(obj.__dict__)
-        else:
-            return obj
+        self.fmt = fmt or os.getenv('JSON_EXPORT_FORMAT', 'pretty')
+        # Copia adicional en NDJSON (results.ndjson, ...) escrita en la misma pasada
+        if ndjson is None:
+            ndjson = os.getenv('JSON_EXPORT_NDJSON', 'false').lower() == 'true'
+        self.ndjson = ndjson
+        self.itersize = itersize or int(os.getenv('JSON_EXPORT_ITERSIZE', 2000))
+        self.last_timings = {}
+
+    def export_rows(self, rows, name):
+        """Serializa filas en streaming a <name>.json (y <name>.ndjson si corresponde)"""
+        writers = []
+        try:
+            # <name>.json se escribe siempre: la API en modo snapshot y los
+            # consumidores lo leen. Con formato ndjson va compacto, junto al .ndjson
+            json_fmt = 'compact' if self.fmt == 'ndjson' else self.fmt
+            writers.append(StreamingJSONWriter(os.path.join(self.data_dir, f'{name}.json'), json_fmt))
+            if self.ndjson or self.fmt == 'ndjson':
+                writers.append(StreamingJSONWriter(os.path.join(self.data_dir, f'{name}.ndjson'), 'ndjson'))
+
+            for row in rows:
+                for writer in writers:
+                    writer.write(row)
+        except Exception:
+            for writer in writers:
+                writer.abort()
+            raise
+
+        for writer in writers:
+            writer.close()
+        return writers[0].count
     
     def generate_results_json(self):
         """Genera results.json con todos los productos"""
         try:
-            products = db.get_all_data()
-            
-            # Convertir a lista de diccionarios serializables
-            products_list = []
-            for product in products:
-                product_dict = dict(product)
-                # Serializar objetos especiales
-                for key, value in product_dict.items():
-                    if isinstance(value, (datetime, Decimal)):
-                        product_dict[key] = self.safe_serialize(value)
-                products_list.append(product_dict)
-            
-            output_file = os.path.join(self.data_dir, 'results.json')
-            with open(output_file, 'w', encoding='utf-8') as f:
-                json.dump(products_list, f, ensure_ascii=False, indent=2)
-            
-            logger.info(f"results.json generado con {len(products_list)} productos")
+            count = self.export_rows(db.iter_all_data(itersize=self.itersize), 'results')
+            logger.info(f"results.json generado con {count} productos")
             return True
             
         except Exception as e:
@@ -71,23 +107,8 @@ class JSONGenerator:
     def generate_files_json(self):
         """Genera files.json con todos los archivos descargados"""
         try:
-            files = db.get_all_files()
-            
-            # Convertir a lista de diccionarios serializables
-            files_list = []
-            for file in files:
-                file_dict = dict(file)
-                # Convertir datetime a string
-                for key, value in file_dict.items():
-                    if isinstance(value, (datetime, Decimal)):
-                        file_dict[key] = self.safe_serialize(value)
-                files_list.append(file_dict)
-            
-            output_file = os.path.join(self.data_dir, 'files.json')
-            with open(output_file, 'w', encoding='utf-8') as f:
-                json.dump(files_list, f, ensure_ascii=False, indent=2)
-            
-            logger.info(f"files.json generado con {len(files_list)} archivos")
+            count = self.export_rows(db.iter_all_files(itersize=self.itersize), 'files')
+            logger.info(f"files.json generado con {count} archivos")
             return True
             
         except Exception as e:
@@ -97,23 +118,8 @@ class JSONGenerator:
     def generate_events_json(self):
         """Genera events.json con los eventos de scraping"""
         try:
-            events = db.get_events(limit=100)
-            
-            # Convertir a lista de diccionarios serializables
-            events_list = []
-            for event in events:
-                event_dict = dict(event)
-                # Convertir datetime a string y Decimal a float
-                for key, value in event_dict.items():
-                    if isinstance(value, (datetime, Decimal)):
-                        event_dict[key] = self.safe_serialize(value)
-                events_list.append(event_dict)
-            
-            output_file = os.path.join(self.data_dir, 'events.json')
-            with open(output_file, 'w', encoding='utf-8') as f:
-                json.dump(events_list, f, ensure_ascii=False, indent=2)
-            
-            logger.info(f"events.json generado con {len(events_list)} eventos")
+            count = self.export_rows(db.get_events(limit=100), 'events')
+            logger.info(f"events.json generado con {count} eventos")
             return True
             
         except Exception as e:
@@ -123,14 +129,32 @@ class JSONGenerator:
     def generate_all_json(self):
         """Genera todos los archivos JSON"""
         logger.info("Generando todos los archivos JSON...")
+        start_time = time.time()
         
-        results = {
-            'results.json': self.generate_results_json(),
-            'files.json': self.generate_files_json(),
-            'events.json': self.generate_events_json()
+        tasks = {
+            'results.json': self.generate_results_json,
+            'files.json': self.generate_files_json,
+            'events.json': self.generate_events_json
         }
         
+        # Cada artefacto corre en su hilo con su propia conexión del pool
+        with ThreadPoolExecutor(max_workers=len(tasks)) as executor:
+            futures = {name: executor.submit(self._timed, task) for name, task in tasks.items()}
+        
+        results = {}
+        self.last_timings = {}
+        for name, future in futures.items():
+            results[name], self.last_timings[name] = future.result()
+            logger.info(f"{name}: {self.last_timings[name]}s")
+        
         success_count = sum(1 for v in results.values() if v)
-        logger.info(f"JSON generados: {success_count}/{len(results)} exitosos")
+        total_time = round(time.time() - start_time, 2)
+        logger.info(f"JSON generados: {success_count}/{len(results)} exitosos en {total_time}s")
         
-        return all(results.values())
\ No newline at end of file
+        return all(results.values())
+    
+    def _timed(self, task):
+        """Ejecuta una tarea y retorna (resultado, segundos)"""
+        start_time = time.time()
+        result = task()
+        return result, round(time.time() - start_time, 2)
\ No newline at end of file
@@ -0,0 +1,201 @@
+import queue
+import threading
+import time
+from utils.logger import setup_logger
+
+logger = setup_logger('pipeline')
+
+# Marca de fin de entrada para los workers de una etapa
+_END = object()
+
+
+class PipelineAborted(Exception):
+    """Otra etapa falló: las demás dejan de producir y consumir"""
+
+
+class _Stage:
+    def __init__(self, name, func, workers=1, queue_size=None, flush=None):
+        self.name = name
+        self.func = func
+        self.workers = workers
+        self.flush = flush
+        # La fuente no tiene cola de entrada
+        self.inbox = queue.Queue(maxsize=queue_size) if queue_size else None
+
+        self.lock = threading.Lock()
+        self.active = workers
+        self.items_in = 0
+        self.items_out = 0
+        self.busy = 0.0
+        self.started = None
+        self.finished = None
+        self.max_depth = 0
+        self.depth_total = 0
+        self.depth_samples = 0
+
+    def stats(self):
+        elapsed = (self.finished or time.perf_counter()) - (self.started or time.perf_counter())
+        processed = self.items_in if self.inbox is not None else self.items_out
+        stats = {
+            'workers': self.workers,
+            'items_in': self.items_in,
+            'items_out': self.items_out,
+            'busy_s': round(self.busy, 3),
+            'elapsed_s': round(elapsed, 3),
+            'throughput': round(processed / elapsed, 2) if elapsed > 0 else 0
+        }
+        if self.inbox is not None:
+            stats.update({
+                'queue_size': self.inbox.maxsize,
+                'max_depth': self.max_depth,
+                'avg_depth': round(self.depth_total / self.depth_samples, 2) if self.depth_samples else 0
+            })
+        return stats
+
+
+class Pipeline:
+    """Etapas productor/consumidor en hilos, unidas por colas acotadas"""
+
+    # Cada etapa recibe un elemento y un emit() para pasar resultados a la
+    # siguiente. Si la cola de destino está llena, emit() bloquea: una etapa
+    # lenta frena a las anteriores en lugar de acumular todo en memoria.
+
+    def __init__(self, name='pipeline', poll_interval=0.1):
+        self.name = name
+        self.poll_interval = poll_interval
+        self._stages = []
+        self._abort = threading.Event()
+        self._error = None
+        self._error_lock = threading.Lock()
+        self.elapsed = 0.0
+
+    def source(self, name, func):
+        """Etapa inicial: func(emit) produce todos los elementos"""
+        self._stages.append(_Stage(name, func))
+        return self
+
+    def stage(self, name, func, workers=1, queue_size=32, flush=None):
+        """Etapa intermedia: func(item, emit); flush(emit) corre al agotarse la entrada"""
+        self._stages.append(_Stage(name, func, workers, max(1, queue_size), flush))
+        return self
+
+    @property
+    def error(self):
+        return self._error
+
+    def _fail(self, stage, error):
+        logger.error(f"{self.name}: error en la etapa {stage.name}: {error}")
+        with self._error_lock:
+            if self._error is None:
+                self._error = error
+        self._abort.set()
+
+    def _put(self, target, item):
+        while True:
+            if self._abort.is_set():
+                raise PipelineAborted()
+            try:
+                target.inbox.put(item, timeout=self.poll_interval)
+                break
+            except queue.Full:
+                continue
+
+        depth = target.inbox.qsize()
+        with target.lock:
+            target.max_depth = max(target.max_depth, depth)
+            target.depth_total += depth
+            target.depth_samples += 1
+
+    def _get(self, stage):
+        while True:
+            try:
+                return stage.inbox.get(timeout=self.poll_interval)
+            except queue.Empty:
+                if self._abort.is_set():
+                    raise PipelineAborted()
+
+    def _run_stage(self, stage, emit):
+        if stage.inbox is None:
+            start = time.perf_counter()
+            stage.func(emit)
+            with stage.lock:
+                stage.busy += time.perf_counter() - start
+            return
+
+        while True:
+            item = self._get(stage)
+            if item is _END:
+                return
+            start = time.perf_counter()
+            stage.func(item, emit)
+            with stage.lock:
+                stage.busy += time.perf_counter() - start
+                stage.items_in += 1
+
+    def _worker(self, index):
+        stage = self._stages[index]
+        target = self._stages[index + 1] if index + 1 < len(self._stages) else None
+
+        def emit(item):
+            with stage.lock:
+                stage.items_out += 1
+            if target is not None:
+                self._put(target, item)
+
+        try:
+            self._run_stage(stage, emit)
+        except PipelineAborted:
+            pass
+        except Exception as e:
+            self._fail(stage, e)
+
+        with stage.lock:
+            stage.active -= 1
+            last = stage.active == 0
+        if not last:
+            return
+
+        # El último worker de la etapa vacía lo pendiente y avisa el fin
+        try:
+            if stage.flush is not None and not self._abort.is_set():
+                start = time.perf_counter()
+                stage.flush(emit)
+                stage.busy += time.perf_counter() - start
+            if target is not None:
+                for _ in range(target.workers):
+                    self._put(target, _END)
+        except PipelineAborted:
+            pass
+        except Exception as e:
+            self._fail(stage, e)
+        finally:
+            stage.finished = time.perf_counter()
+
+    def run(self):
+        """Ejecuta todas las etapas hasta agotar la fuente; relanza el primer error"""
+        start = time.perf_counter()
+        threads = []
+        for index, stage in enumerate(self._stages):
+            stage.started = start
+            for n in range(stage.workers):
+                thread = threading.Thread(
+                    target=self._worker, args=(index,),
+                    name=f"{self.name}-{stage.name}-{n}", daemon=True
+                )
+                thread.start()
+                threads.append(thread)
+
+        for thread in threads:
+            thread.join()
+        self.elapsed = time.perf_counter() - start
+
+        if self._error is not None:
+            raise self._error
+        return self.stats()
+
+    def stats(self):
+        """Throughput y profundidad de cola por etapa"""
+        return {
+            'elapsed_s': round(self.elapsed, 3),
+            'stages': {stage.name: stage.stats() for stage in self._stages}
+        }
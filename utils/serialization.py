@@ -0,0 +1,155 @@
+import json
+import time
+from datetime import date, datetime
+from decimal import Decimal
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    from flask.json.provider import DefaultJSONProvider
+except ImportError:
+    DefaultJSONProvider = object
+
+
+def json_default(obj):
+    """Convierte los tipos que no son JSON nativo (datetime, Decimal)"""
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, Decimal):
+        return float(round(obj, 2))
+    if hasattr(obj, '__dict__'):
+        return obj.__dict__
+    raise TypeError(f"Tipo no serializable: {type(obj).__name__}")
+
+
+# Diferencias de orjson frente a json.dumps(indent=2, ensure_ascii=False), el
+# formato anterior de data/*.json (ver compatibility()):
+#   - floats con exponente: 1e16 en lugar de 1e+16, 1e-7 en lugar de 1e-07
+#   - NaN e Infinity salen como null (json escribía NaN, que no es JSON válido)
+#   - date se serializa en ISO 8601 (antes fallaba)
+# El texto no ASCII sale igual (UTF-8 sin escapar). Los enteros de más de 64
+# bits, que orjson rechaza, se serializan con json.
+# Las respuestas de la API ya no ordenan las claves ni escapan el texto no ASCII
+# como hacía jsonify de Flask.
+
+def dumps(obj, pretty=False):
+    """Serializa a bytes UTF-8; usa orjson si está instalado"""
+    if orjson is not None:
+        option = orjson.OPT_INDENT_2 if pretty else 0
+        try:
+            return orjson.dumps(obj, default=json_default, option=option)
+        except orjson.JSONEncodeError as e:
+            if 'Integer exceeds' not in str(e):
+                raise
+
+    if pretty:
+        text = json.dumps(obj, ensure_ascii=False, indent=2, default=json_default)
+    else:
+        text = json.dumps(obj, ensure_ascii=False, separators=(',', ':'), default=json_default)
+    return text.encode('utf-8')
+
+
+def loads(data):
+    """Parsea JSON desde str o bytes"""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """Proveedor JSON de Flask basado en dumps(): datetime en ISO 8601 y Decimal como float"""
+
+    def dumps(self, obj, **kwargs):
+        return dumps(obj).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(dumps(obj) + b"\n", mimetype=self.mimetype)
+
+
+def _legacy_dumps(rows):
+    """Camino anterior: conversión manual fila por fila + json.dumps(indent=2)"""
+    converted = []
+    for row in rows:
+        row = dict(row)
+        for key, value in row.items():
+            if isinstance(value, datetime):
+                row[key] = value.isoformat()
+            elif isinstance(value, Decimal):
+                row[key] = float(round(value, 2))
+        converted.append(row)
+    return json.dumps(converted, ensure_ascii=False, indent=2).encode('utf-8')
+
+
+def compatibility():
+    """Casos donde dumps(pretty=True) no coincide byte a byte con el camino anterior"""
+    cases = {
+        'texto no ASCII': {'title': 'Cámara reflex ñandú – 50% OFF'},
+        'float': {'price': 0.1 + 0.2},
+        'float grande': {'price': 1e16},
+        'float chico': {'price': 1e-7},
+        'NaN': {'price': float('nan')},
+        'datetime': {'scraped_date': datetime(2026, 1, 1, 10, 0, 0, 123456)},
+        'Decimal': {'price': Decimal('1299999.005')},
+        'entero grande': {'id': 2 ** 70},
+    }
+    differences = {}
+    for name, row in cases.items():
+        legacy, current = _legacy_dumps([row]), dumps([row], pretty=True)
+        if legacy != current:
+            differences[name] = (legacy, current)
+    return differences
+
+
+def benchmark(rows=100000, rounds=3):
+    """Compara el serializador central con el camino anterior sobre filas tipo scraped_data"""
+    now = datetime.now()
+    payload = [
+        {
+            'id': i,
+            'title': f'Notebook Modelo {i} 16GB 512GB SSD 15.6" Gris',
+            'price': Decimal('1299999.00') + i,
+            'original_price': None,
+            'discount_percentage': None,
+            'quantity': 1,
+            'page_number': i // 50 + 1,
+            'url': f'https://www.mercadolibre.com.ar/notebook-{i}/p/MLA{50000000 + i}',
+            'image_url': None,
+            'description': f'Notebook Modelo {i}',
+            'category': 'laptop',
+            'scraped_date': now,
+            'last_modified': now,
+            'is_active': True,
+            'data_hash': f'{i:064x}'
+        }
+        for i in range(rows)
+    ]
+
+    candidates = {
+        'legacy (json indent=2)': _legacy_dumps,
+        f"dumps pretty ({'orjson' if orjson else 'json'})": lambda data: dumps(data, pretty=True),
+        f"dumps compact ({'orjson' if orjson else 'json'})": dumps,
+    }
+
+    print(f"{rows} filas")
+    for name, serialize in candidates.items():
+        best = None
+        for _ in range(rounds):
+            start = time.perf_counter()
+            size = len(serialize(payload))
+            elapsed = time.perf_counter() - start
+            best = elapsed if best is None else min(best, elapsed)
+        print(f"{name:<28} {best * 1000:9.1f} ms  ({size / 1024 / 1024:.1f} MB)")
+
+
+if __name__ == '__main__':
+    benchmark()
+    print("\nDiferencias con el camino anterior:")
+    for name, (legacy, current) in compatibility().items():
+        print(f"  {name:<16} {legacy.decode()!r} -> {current.decode()!r}")